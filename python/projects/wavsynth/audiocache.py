@@ -0,0 +1,87 @@
+'''
+byte-budgeted LRU cache for rendered audio arrays.
+
+replaces the unbounded lru_cache on the synth entry points. float args
+are quantized (to a few significant digits) before lookup, so that
+near-identical frequencies and durations share one entry. the wrapped
+function is always called with the quantized args, so the result does
+not depend on which caller filled the entry first.
+'''
+
+from collections import OrderedDict
+from functools import wraps
+
+
+def quantize(val, sigdigits=6):
+    'round floats to sigdigits significant digits, pass others through'
+    if isinstance(val, float):
+        return float(f'{val:.{sigdigits}g}')
+    return val
+
+
+class AudioCache:
+    'LRU cache of arrays with a total byte budget and hit/miss counters'
+
+    def __init__(self, maxbytes=512 * 2**20, sigdigits=6):
+        self.maxbytes  = maxbytes
+        self.sigdigits = sigdigits
+        self.entries   = OrderedDict()
+        self.nbytes    = 0
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+    def get(self, key):
+        'cached array for key (or None), marks it as recently used'
+        val = self.entries.get(key)
+        if val is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return val
+
+    def put(self, key, val):
+        'store val under key, evict least recently used entries to fit'
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key).nbytes
+        if val.nbytes > self.maxbytes:
+            return val      # would evict everything; do not keep it
+        self.entries[key] = val
+        self.nbytes += val.nbytes
+        while self.nbytes > self.maxbytes:
+            _, old = self.entries.popitem(last=False)
+            self.nbytes -= old.nbytes
+            self.evictions += 1
+        return val
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        'counters as a dict (handy for logging)'
+        return dict(hits=self.hits, misses=self.misses,
+                    evictions=self.evictions, entries=len(self.entries),
+                    nbytes=self.nbytes, maxbytes=self.maxbytes)
+
+
+def audioCache(cache):
+    'decorator: memoize an audio function in cache (with quantized args)'
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            q      = cache.sigdigits
+            args   = tuple(quantize(a, q) for a in args)
+            kwargs = { k : quantize(v, q) for k, v in kwargs.items() }
+            key    = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+            val    = cache.get(key)
+            if val is None:
+                val = cache.put(key, func(*args, **kwargs))
+            return val
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+sharedCache = AudioCache()
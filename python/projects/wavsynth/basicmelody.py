@@ -17,6 +17,11 @@ from scipy.io import wavfile
 import basicsynth as bsynth
 from basicsynth import iround, FS, F32
 import basicsequencer as bseq
+import wavstream
+import masterbus
+import parallelrender
+import segments
+from pattern import Pattern
 from copy import deepcopy as dcopy
 
 from matplotlib import pyplot as plt
@@ -223,11 +228,67 @@ def expandKeypat(keypat, dur=1, vol=0):
     return ret
 
 
-def pat2wav(pat, tstep=12000, extradur=0.25):
+def pat2wav(pat, tstep=12000, extradur=0.25, out=None, workers=1,
+            segment=0):
     '''
     convert pattern to wav.
-    patten should be list of list of 4-length tone-info
+    patten should be list of list of 4-length tone-info, a
+    pattern.Pattern or a list of segments.Segment (rendered once per
+    unique segment)
+    out     : mix and write to this .wav/.flac in chunks (bounded memory)
+              instead of returning the music
+    workers : > 1 (or None for all cores) renders in a process pool
+    segment : > 0 cuts pat into segments of that many frames, every
+              unique segment is rendered once. only whole segments are
+              reused, a repeat that does not start on a segment boundary
+              is rendered again
+    the options that go together (anything else is a ValueError):
+      list pattern     : out and / or segment, or workers alone
+      Pattern          : out
+      list of segments : out
+    the mix goes through the master bus limiter (see masterbus.py)
+    unless pat2wav.limit is False
     '''
+    checkOptions(pat, out, workers, segment)
+    if out is not None:
+        blocks = wavstream.slidingMix(patStream(pat, tstep, extradur, segment),
+                                      gain=0.5)
+        if pat2wav.limit:
+            blocks = masterbus.streamMaster(blocks)
+        wavstream.writeStream(out, blocks, FS)
+        return None
+    music = mixPattern(pat, tstep, extradur, workers, segment)
+    if pat2wav.limit:
+        music = masterbus.master(music)
+    return music
+
+
+pat2wav.limit = True
+
+
+def checkOptions(pat, out=None, workers=1, segment=0):
+    'ValueError for pat2wav options that do not go together'
+    if (isinstance(pat, Pattern) or segments.isTrack(pat)) and (
+            workers != 1 or segment):
+        raise ValueError('pat2wav: a Pattern or a list of segments is '
+                         'rendered as it is, without workers or segment')
+    if workers != 1 and (out is not None or segment):
+        raise ValueError('pat2wav: workers renders a list pattern in '
+                         'memory, it can not be combined with out or '
+                         'segment')
+
+
+def mixPattern(pat, tstep=12000, extradur=0.25, workers=1, segment=0):
+    'the plain mix of pat2wav (0.5 gain, no master bus)'
+    checkOptions(pat, None, workers, segment)
+    if isinstance(pat, Pattern):
+        return pat.render(tstep, extradur)
+    if segment:
+        pat = segments.splitPattern(pat, segment)
+    if segments.isTrack(pat):
+        return segments.renderTrack(pat, tstep, extradur)
+    if workers != 1:
+        return parallelrender.pat2wavParallel(pat, tstep, extradur, workers)
     dur = tstep / FS
     music = []
     for idx, frame in enumerate(pat):
@@ -242,6 +303,33 @@ def pat2wav(pat, tstep=12000, extradur=0.25):
     return music
 
 
+def patStream(pat, tstep=12000, extradur=0.25, segment=0):
+    'the lazy (onset, vec) events pat2wav(out=...) mixes (no 0.5 gain)'
+    if isinstance(pat, Pattern):
+        return patEvents(pat.toList(), tstep, extradur)
+    if segment:
+        pat = segments.splitPattern(pat, segment)
+    if segments.isTrack(pat):
+        return segments.trackEvents(pat, tstep, extradur)
+    return patEvents(pat, tstep, extradur)
+
+
+def patEvents(pat, tstep=12000, extradur=0.25):
+    'pat2wav notes as lazy (onset, vec) events (ends with a length marker)'
+    dur = tstep / FS
+    length = 0
+    for idx, frame in enumerate(pat):
+        flen = 1
+        for val in frame:
+            vec = bsynth.sampleSynth(
+                    val[0], val[1], dur*val[2] + extradur,
+                    val[3])
+            flen = max(flen, len(vec))
+            yield idx * tstep, vec
+        length = max(length, (idx + 1) * tstep + flen)
+    yield length, np.zeros(0, dtype=F32)
+
+
 def attachSilence(pattern, nl=8, nr=8):
     'attach silence to both ends of the pattern'
     left  = [ [] for ii in range(nl) ]
@@ -255,6 +343,8 @@ def attachSilence(pattern, nl=8, nr=8):
 
 def repeatPatten(pat, count):
     'repeat patten pat count times'
+    if isinstance(pat, Pattern):
+        return pat.repeat(count)
     ret = []
     for idx in range(count):
         ret.extend(dcopy(pat))
@@ -278,6 +368,8 @@ def addBackground(pattern, keys, dur=-1, vol=-1):
     if dur < 0 : dur = addBackground.bgdur
     if vol < 0 : vol = addBackground.bgvol
     keys = chordKeyseqExpand(keys, dur, vol)
+    if isinstance(pattern, Pattern):   # a new pattern, nothing is copied
+        return pattern.background(keys)
     for idx, frame in enumerate(pattern):
         keyseq = keys[idx%len(keys)]
         frame  = list(frame)
@@ -325,6 +417,10 @@ def expand(*args):
 
 
 def merge(pat1, pat2):
+    if isinstance(pat1, Pattern) or isinstance(pat2, Pattern):
+        pat1, pat2 = [ pat if isinstance(pat, Pattern) else
+                       Pattern.fromList(pat) for pat in (pat1, pat2) ]
+        return pat1.merge(pat2)
     return [ expand(*x1, *x2) for x1, x2 in zip(pat1, pat2) ]
 
 
@@ -7,46 +7,25 @@ from scipy.io import wavfile
 from matplotlib import pyplot as plt
 
 import basicsynth as synth
+import mixer
+import wavstream
+import parallelrender
+import scorecompiler
+import scoreparser
 
 FS  = synth.FS
 F32 = synth.F32
 random.seed(0)
 
 
-def sumVecs(vecList):
-    'sum all vecs(potentially of diff len) in a list'
-    if not vecList:
-        return np.zeros(1, dtype=F32)
-    maxSize = max([len(vec) for vec in vecList])
-    ret = np.zeros(maxSize, dtype=F32)
-    for vec in vecList:
-        ret[:len(vec)] += vec
-    return ret
-
-
 def sequenceDirect(llvec, step):
     '''
     naive sequencing of key sounds
     llvec : list of list of f32 vecs
     step  : number of samples for each step
+    (every vec is mixed once, in place, see mixer.py)
     '''
-    pos = 0
-    maxSize = 0
-    frames = []
-    # combine vecs in all frames, find out max size
-    for vecList in llvec:
-        sv = sumVecs(vecList)
-        frames.append(sv)
-        pos += step
-        if pos + len(sv) > maxSize:
-            maxSize = pos + len(sv)
-    ret = np.zeros(maxSize, dtype=F32)
-    pos = 0
-    # sequence all the vectors
-    for vec in frames:
-        ret[pos:pos+len(vec)] += vec
-        pos += step
-    return ret
+    return mixer.sequenceFrames(llvec, step)
 
 
 def sequenceApVsGp():
@@ -75,24 +54,39 @@ def str2klseq(data):
     return data
 
 
-def klseq2music(klseq, kdur=1, step=8000):
+def klseq2music(klseq, kdur=1, step=8000, workers=1):
     '''
     returns music array from seq of list of keys
-    klseq : list of list of keys
-    kdur  : base key duration
-    step  : step in samples
+    klseq   : list of list of keys
+    kdur    : base key duration
+    step    : step in samples
+    workers : render in a process pool (see parallelrender.py)
+    '''
+    if workers != 1:
+        return parallelrender.klseq2musicParallel(klseq, kdur, step, workers)
+    # unique notes are rendered once and placed many times
+    events, notes = scorecompiler.compileKlseq(klseq, kdur, step)
+    music = scorecompiler.renderEvents(events, notes, 'additive', tail=step,
+                                       minlen=len(klseq) * step + 1 if klseq else 0)
+    return music
+
+
+def klseqEvents(klseq, kdur=1, step=8000):
+    '''
+    same as klseq2music, but yields (onset, vec) lazily frame by frame.
+    ends with an empty vec that marks the length klseq2music would give
     '''
-    llvec = []
-    for frame in klseq: # each frame is a list of keys
-        frvecs = []     # vecs for frame
+    length = 0
+    for idx, frame in enumerate(klseq):
+        flen = 1
         for key in frame:
             kt4 = synth.parseKey(key)   # key(str) -> (octave, key, dur, vol)
             f, d, v = synth.kt4fdv(kt4) # -> (freq, dur, vol)
             vec = synth.additiveSynth(f, d * kdur, v) # -> sample vec
-            frvecs.append(vec)
-        llvec.append(frvecs)
-    music = sequenceDirect(llvec, step)
-    return music
+            flen = max(flen, len(vec))
+            yield idx * step, vec
+        length = max(length, (idx + 1) * step + flen)
+    yield length, np.zeros(0, dtype=F32)
 
 
 def readStripComments(fi):
@@ -107,12 +101,21 @@ def readStripComments(fi):
     return ret
 
 
-def txt2wav(inp, out):
-    'load txt from inp and write wav to out'
-    with open(inp) as fi:
-        data = readStripComments(fi)
-    data = str2klseq(data)
-    music = klseq2music(data, 1, 12000)
+def txt2wav(inp, out, streaming=False):
+    '''
+    load txt from inp and write wav to out
+    streaming : mix and write in chunks (bounded memory, .wav or .flac)
+    '''
+    tokens, nframes = scoreparser.parseFile(inp)   # ScoreSyntaxError if bad
+    if streaming:
+        data   = scoreparser.tokens2klseq(tokens, nframes)
+        events = klseqEvents(data, 1, 12000)
+        wavstream.writeStream(out, wavstream.slidingMix(events), FS)
+        return
+    step   = 12000
+    events, notes = scorecompiler.compileTokens(tokens, 1, step)
+    music  = scorecompiler.renderEvents(events, notes, 'additive', tail=step,
+                                        minlen=nframes * step + 1)
     wavfile.write(out, FS, music)
 
 
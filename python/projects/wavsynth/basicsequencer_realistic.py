@@ -38,46 +38,21 @@ from scipy.io import wavfile
 from matplotlib import pyplot as plt
 
 import basicsynth_realistic as synth
+import mixer
 
 FS  = synth.FS
 F32 = synth.F32
 random.seed(0)
 
 
-def sumVecs(vecList):
-    'sum all vecs(potentially of diff len) in a list'
-    if not vecList:
-        return np.zeros(1, dtype=F32)
-    maxSize = max([len(vec) for vec in vecList])
-    ret = np.zeros(maxSize, dtype=F32)
-    for vec in vecList:
-        ret[:len(vec)] += vec
-    return ret
-
-
 def sequenceDirect(llvec, step):
     '''
     naive sequencing of key sounds
     llvec : list of list of f32 vecs
     step  : number of samples for each step
+    (every vec is mixed once, in place, see mixer.py)
     '''
-    pos = 0
-    maxSize = 0
-    frames = []
-    # combine vecs in all frames, find out max size
-    for vecList in llvec:
-        sv = sumVecs(vecList)
-        frames.append(sv)
-        pos += step
-        if pos + len(sv) > maxSize:
-            maxSize = pos + len(sv)
-    ret = np.zeros(maxSize, dtype=F32)
-    pos = 0
-    # sequence all the vectors
-    for vec in frames:
-        ret[pos:pos+len(vec)] += vec
-        pos += step
-    return ret
+    return mixer.sequenceFrames(llvec, step)
 
 
 def sequenceApVsGp():
@@ -178,12 +153,11 @@ def str2klseq(data):
     return data
 
 
-def klseq2music(klseq, kdur=1, step=8000):
+def humanizeKey(key, kdur, ii, nkeys, rng=None):
     '''
-    returns music array from seq of list of keys
-    klseq : list of list of keys
-    kdur  : base key duration
-    step  : step in samples
+    render key number ii of a frame with nkeys keys
+    rng : numpy Generator of the note event, None uses the global random
+    returns (vec, delay), delay is the humanized onset delay in samples
     '''
 
     # Strength of the random variation in timing in seconds (set to 0 for no variation)
@@ -192,30 +166,79 @@ def klseq2music(klseq, kdur=1, step=8000):
     # delay between indvidual notes of a chord in seconds
     chord_note_offset = 0.025
 
+    # Increase volume if there is more than one note at once, as seen in human instrumentalists:
+    boost = nkeys > 1
+
+    kt4 = parseKey(key)   # key(str) -> (octave, key, dur, vol)
+    f, d, v = kt4fdv(kt4) # -> (freq, dur, vol)
+    vec = synth.additiveSynth(f, d * kdur, v + 0.25*v*boost, rng) # -> sample vec
+
+    # Add random delay to each onset and a constant delay between notes of chords
+    gauss = random.gauss if rng is None else rng.normal
+    delay_offset = FS*chord_note_offset
+    delay_rand = FS*(abs(gauss(0, rand_timing)))
+    delay = ii*delay_offset + delay_rand
+    return vec, delay
+
 
-    llvec = []
-    for frame in klseq: # each frame is a list of keys
-        frvecs = []     # vecs for frame
-
-        # Increase volume if there is more than one note at once, as seen in human instrumentalists:
-        boost = len(frame) > 1 
-        
-        for ii, key in enumerate(frame):
-            kt4 = parseKey(key)   # key(str) -> (octave, key, dur, vol)
-            f, d, v = kt4fdv(kt4) # -> (freq, dur, vol)
-            vec = synth.additiveSynth(f, d * kdur, v + 0.25*v*boost) # -> sample vec
-
-            # Add random delay to each onset and a constant delay between notes of chords 
-            delay_offset = FS*chord_note_offset
-            delay_rand = FS*(abs(random.gauss(0, rand_timing)))
-            delay = int(ii*delay_offset + delay_rand)
-            vec = np.r_[np.zeros(delay),
-                        vec,
-                        np.zeros((len(frame)-ii) * delay)]
-
-            frvecs.append(vec)
-        llvec.append(frvecs)
-    music = sequenceDirect(llvec, step)
+def humanizeEvent(job):
+    'humanizeKey for event index of a score with seed (pool friendly)'
+    key, kdur, ii, nkeys, seed, index = job
+    return humanizeKey(key, kdur, ii, nkeys, synth.noteRng(seed, index))
+
+
+def initWorker(engine):
+    'carry the sine engine of the parent into a pool worker'
+    synth.sinOsc.engine = engine
+
+
+def klseq2music(klseq, kdur=1, step=8000, subsample=False, seed=None,
+                workers=1):
+    '''
+    returns music array from seq of list of keys
+    klseq     : list of list of keys
+    kdur      : base key duration
+    step      : step in samples
+    subsample : place notes at their exact (fractional) humanized onset
+                with a fractional delay kernel instead of whole samples
+    seed      : score seed. every key event gets its own random stream
+                from (seed, event index), so the result does not depend
+                on the render order. None draws from the global random
+    workers   : render the events in a process pool (needs a seed)
+    '''
+    if seed is None and workers != 1:
+        raise ValueError('parallel rendering needs a score seed')
+    frames = [ (idx, ii, len(frame), key) for idx, frame in enumerate(klseq)
+                                          for ii, key in enumerate(frame) ]
+    if seed is None:
+        notes = [ humanizeKey(key, kdur, ii, n) for _, ii, n, key in frames ]
+    else:
+        jobs = [ (key, kdur, ii, n, seed, evidx)
+                 for evidx, (_, ii, n, key) in enumerate(frames) ]
+        if workers == 1:
+            notes = list(map(humanizeEvent, jobs))
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            # spawned workers would start with the default engine
+            with ProcessPoolExecutor(workers, initializer=initWorker,
+                                     initargs=(synth.sinOsc.engine,)) as pool:
+                notes = list(pool.map(humanizeEvent, jobs, chunksize=8))
+
+    # humanization only shifts onsets, the mixer places every note at its
+    # offset so no padded copies are made
+    onsets, vecs = [], []
+    flens  = [ 1 ] * len(klseq)
+    for (idx, ii, n, _), (vec, delay) in zip(frames, notes):
+        if not subsample:
+            delay = int(delay)
+        onsets.append(idx * step + delay)
+        vecs.append(vec)
+        # frame length as if the note was padded (keeps the old length)
+        flens[idx] = max(flens[idx], int(delay) * (n - ii + 1) + len(vec))
+    length = max([ (idx + 1) * step + flen for idx, flen in enumerate(flens) ],
+                 default=0)
+    order = 3 if subsample else None
+    music = mixer.mixEvents(onsets, vecs, length=length, order=order)
     return music
 
 
@@ -1,13 +1,19 @@
 #!/usr/bin/env python
 
+import os
 import numpy as np
 import re
 import json
-from scipy.io import wavfile
-from matplotlib import pyplot as plt
-
+import hashlib
 from functools import lru_cache
-import soundfile as sf
+from itertools import groupby
+
+from audiocache import audioCache, sharedCache, quantize
+from oscillator import sinOsc, phaseInc, phaseRamp, PHASE_ONE
+from envelope import adsrFadeEnvelopes, FadeEnvelope
+from samplebank import sampleBank
+from sustainloop import SustainLoop
+from rendercache import RenderCache, DEFAULT_DIR
 
 
 FS  = 48000         # project sampling rate
@@ -21,8 +27,22 @@ def t2s(t):
     return iround(FS * t)
 
 
-@lru_cache(maxsize=None)
+def cacheStats():
+    'hit/miss/eviction counters of the shared waveform cache'
+    return sharedCache.stats()
+
+
+def setOscEngine(engine):
+    'pick the sine engine (see oscillator.py), drops cached notes'
+    sinOsc.engine = engine
+    sharedCache.clear()
+
+
+@audioCache(sharedCache)
 def getSinWav(freq, nsamp, amp=0.2):
+    if sinOsc.engine != 'exact':
+        phase, _ = phaseRamp(freq, nsamp, FS)
+        return sinOsc(phase, amp)
     tx    = np.arange(nsamp)
     wav   = np.sin(2 * np.pi * freq / FS * tx) * amp
     return F32(wav)
@@ -30,6 +50,7 @@ def getSinWav(freq, nsamp, amp=0.2):
 
 def justSinWav():
     'just a simple sin wav (pure tone)'
+    from scipy.io import wavfile
     freq  = 800     # hz
     dur   = 1       # s
     nsamp = iround(FS * dur)
@@ -39,6 +60,7 @@ def justSinWav():
 
 def seqManySinWavs():
     'multiple sin wavs of different freqs arranged sequentially'
+    from scipy.io import wavfile
     freq  = 200
     dur   = 0.5
     nsamp = iround(dur * FS)
@@ -77,19 +99,108 @@ def adsrFadeEnvelope(attack, decay, sustain, release, sustainAmp=0.4, fade=4):
     '''
     similar to adsr, but with slow exponential decay during sustain.
     this captures behavior of a plucked string
+    (vector sustainAmp/fade give a family of envelopes, see envelope.py)
     '''
-    env = [
-        np.linspace(0, 1, attack),
-        np.linspace(1, sustainAmp, decay),
-        np.exp(-np.linspace(0, fade, sustain)) * sustainAmp,
-        np.linspace(np.exp(-fade) * sustainAmp, 0, release)
-    ]
-    env = np.hstack(env)
-    return F32(env)
+    return adsrFadeEnvelopes(attack, decay, sustain, release, sustainAmp, fade)
+
+
+def headPeak(sig, nhead):
+    '''
+    peak of sig (or of every row) within its first nhead samples (one
+    nhead per row for a 2d sig). the synth envelopes peak at the end of
+    the attack and only fall after attack + decay, so a head of
+    attack + decay + a couple of periods gives the peak without a pass
+    over the whole note
+    '''
+    if np.ndim(nhead) == 0:
+        return abs(sig[..., :nhead]).max(axis=-1)
+    nhead = np.asarray(nhead)
+    head  = abs(sig[:, :nhead.max()])
+    head[np.arange(head.shape[1]) >= nhead[:, None]] = 0
+    return head.max(axis=1)
+
+
+def partialBank(fhars, amps, envs, block=8):
+    '''
+    renders a bank of partials into one preallocated f32 accumulator.
+    fhars : frequency of each partial (in Hz)
+    amps  : amplitude of each partial
+    envs  : (partials x samples) envelopes, or one envelope shared by all
+    block : number of partials evaluated together as a 2d batch
+    '''
+    fhars = np.asarray(fhars, dtype=np.float64)
+    amps  = np.asarray(amps, dtype=F32)
+    ns    = envs.shape[-1]
+    tx    = np.arange(ns)
+    acc   = np.zeros(ns, dtype=F32)
+    for lo in range(0, len(fhars), block):
+        hi    = min(lo + block, len(fhars))
+        if sinOsc.engine == 'exact':
+            phase = np.multiply.outer(2 * np.pi * fhars[lo:hi] / FS, tx)
+            wav   = F32(np.sin(phase, out=phase))
+        else:
+            phase, _ = phaseRamp(fhars[lo:hi], ns, FS)
+            wav   = sinOsc(phase)
+        wav  *= amps[lo:hi, None]
+        wav  *= envs[lo:hi] if envs.ndim == 2 else envs
+        acc  += wav.sum(axis=0)
+    return acc
+
+
+def partialBankBatch(fhars, amps, envs, out=None, block=8):
+    '''
+    partialBank for many notes at once, one note per row of out.
+    fhars : (notes x partials) frequency of each partial (in Hz)
+    amps  : (notes x partials) amplitudes, 0 for the partials a note
+            does not have (above nyquist, always the trailing ones)
+    envs  : (notes x partials x samples) envelopes, the first or the
+            second axis may be 1 (shared by all notes / partials)
+    the python loop runs over partials, not notes. partials are summed
+    in blocks as in partialBank, so every row is the same as the one
+    partialBank gives for that note
+    '''
+    fhars = np.asarray(fhars, dtype=np.float64)
+    amps  = np.asarray(amps, dtype=F32)
+    nnote, npart = fhars.shape
+    ns    = envs.shape[-1]
+    tx    = np.arange(ns)
+    out   = np.empty((nnote, ns), dtype=F32) if out is None else out
+    if npart > block or not amps[:, 0].all():
+        out[:] = 0
+    acc   = out if npart <= block else np.empty_like(out)
+    for lo in range(0, npart, block):
+        first = None
+        for k in range(lo, min(lo + block, npart)):
+            rows  = np.flatnonzero(amps[:, k])
+            if not len(rows):
+                break
+            full  = len(rows) == nnote
+            if rows[-1] == len(rows) - 1:           # leading rows: a view
+                rows = slice(0, len(rows))
+            if sinOsc.engine == 'exact':
+                phase = np.multiply.outer(2 * np.pi * fhars[rows, k] / FS, tx)
+                wav   = F32(np.sin(phase, out=phase))
+            else:
+                wav   = sinOsc(phaseRamp(fhars[rows, k], ns, FS)[0])
+            wav  *= amps[rows, k, None]
+            env   = envs[:, min(k, envs.shape[1] - 1)]
+            wav  *= env if len(env) == 1 or full else env[rows]
+            if first is None:
+                first = rows
+                acc[rows] = wav
+            else:
+                acc[rows] += wav
+        if first is None:
+            break
+        if acc is not out:
+            out[first] += acc[first]
+    return out
 
 
 def seqManySinWavsWithEnv():
     'multiple sin wavs of different freqs arranged in seq (with env)'
+    from scipy.io import wavfile
+    from matplotlib import pyplot as plt
     freq  = 400
     ratio = 6/5
     sil   = np.zeros(FS//10, dtype=F32)
@@ -128,32 +239,85 @@ def additiveSynth(freq, dur, vol):
     dur  : duration in seconds (only controls sustain)
     vol  : volume (linear)
     '''
+    return additiveSynthBatch([freq], dur, [vol])[0]
+
+
+def additiveAdsr(dur):
+    'attack, decay, sustain, release (in samples) of additiveSynth'
+    return (iround(0.003 * FS), iround(0.03 * FS), iround(dur * FS),
+            iround(0.02 * FS))
+
+
+def additivePartials(freq):
+    '''
+    partials of additiveSynth notes at freq (scalar or vector): harmonic
+    number, amplitude and sustain fade of each partial, and which of
+    them stay below nyquist (per note). shared with the block renderer
+    in streamsynth.py
+    '''
     harlim   = 40
     harjump  = 5
 
-    attack   = iround(0.003 * FS)
-    decay    = iround(0.03  * FS)
-    sustain  = iround(dur   * FS)
-    release  = iround(0.02  * FS)
+    hars   = np.arange(1, harlim, harjump)
+    amps   = (hars + 2.0) ** -2.5       # amplitude depends on partial har
+    fades  = 2.5 + 0.4 * hars           # fade depends on the partial har
+    keep   = np.multiply.outer(freq, hars) <= FS * 0.4  # respect nyquist
+    return hars, amps, fades, keep
+
+
+def additiveEnvelope(dur, fades):
+    'lazy envelopes of additiveSynth partials with fades (see envelope.py)'
+    return FadeEnvelope(*additiveAdsr(dur), sustainAmp=0.8, fade=fades)
+
+
+def additiveLevel(freq, vol):
+    '''
+    (nhead, gains) of additiveSynth notes: the peak is taken over the
+    first nhead samples and the note is scaled by gains / peak
+    '''
+    freq  = np.asarray(freq, dtype=np.float64)
+    attack, decay = additiveAdsr(0)[:2]
+    nhead = attack + decay + 2 * np.rint(FS / freq).astype(int)
+    return nhead, (0.5, vol, (110 / freq) ** 0.4)
+
+
+def normalizeRows(out, nheads, gains):
+    '''
+    scale every row of out to a head peak of gains (per row), as the
+    single note synths do: row / peak * gain
+    '''
+    peaks = headPeak(out, nheads)
+    out  /= peaks[:, None]
+    for gain in gains:                  # one factor after the other
+        out *= F32(gain)[:, None] if np.ndim(gain) else F32(gain)
+    return out
 
-    combined   = 0
-    for har in range(1, harlim, harjump):
-        fhar = freq * har         # frequency for the partial
-        if fhar > FS * 0.4:      # respect nyquist
-            break
-        fade = 2.5 + 0.4 * har      # fade depends on the partial har
-        amp  = (har+2) ** -2.5    # amplitude depends on partial har
-        env  = adsrFadeEnvelope(attack, decay, sustain, release,
-                                sustainAmp=0.8, fade=fade)
-        partial = getSinWav(fhar, len(env), amp=amp) * env
-        combined = combined + partial
-    correction = (110 / freq) ** 0.4
-    ret = combined / abs(combined).max() * 0.5 * vol * correction
-    return ret
+
+def additiveSynthBatch(freqs, dur, vols, out=None, block=16):
+    '''
+    additiveSynth for many notes of the same dur, one note per row (of
+    out, if given). the partial envelopes do not depend on freq, so they
+    are built once, and block notes are rendered together
+    '''
+    freqs  = np.asarray(freqs, dtype=np.float64)
+    vols   = np.asarray(vols, dtype=np.float64)
+    hars, amps, fades, keep = additivePartials(freqs)
+    envs   = additiveEnvelope(dur, fades).render()
+    if out is None:
+        out = np.empty((len(freqs), envs.shape[1]), dtype=F32)
+    for lo in range(0, len(freqs), block):
+        freq   = freqs[lo:lo+block]
+        fhars  = np.multiply.outer(freq, hars)  # frequency for each partial
+        rows   = partialBankBatch(fhars, np.where(keep[lo:lo+block], amps, 0),
+                                  envs[None], out[lo:lo+block])
+        nheads, gains = additiveLevel(freq, vols[lo:lo+block])
+        normalizeRows(rows, nheads, gains)
+    return out
 
 
 def seqManyMuliHarmonicWav():
     'multiple additiveSynth output'
+    from scipy.io import wavfile
     freq  = 220
     ratio = 6/5
     sil   = np.zeros(FS//10, dtype=F32)
@@ -209,6 +373,8 @@ def parseKey(key):
     return a 4-tuple of octave, key, duration, volume
     '''
     mt  = _keypatt.match(key.strip())
+    if mt is None:
+        raise ValueError(f'bad key: {key!r}')
     oc  = int(mt.group(1))
     key = mt.group(2)
     dur = mt.group(3)
@@ -236,7 +402,7 @@ def getSampleEnv(dur):
 
 def applyEnv(audio, dur, vol):
     vol1 = 10 ** (vol / 10)
-    audio = audio / abs(audio).max() * 0.5 * vol1
+    audio = np.array(audio, dtype=F32)  # scaling it first cancels out below
     env   = getSampleEnv(dur)
     if len(audio) < len(env):
         diff  = len(env) - len(audio)
@@ -249,8 +415,21 @@ def applyEnv(audio, dur, vol):
     return F32(audio)
 
 
-with open('piano-harmonics.json') as fi:
-    __pianohar = json.load(fi)
+@lru_cache(maxsize=None)
+def pianoHarmonics():
+    '''
+    piano harmonic profile, loaded on first use (next to this file)
+    returns read-only arrays of peaks (x fundamental) and linear amps
+    '''
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'piano-harmonics.json')
+    with open(path) as fi:
+        har = json.load(fi)
+    peaks = np.asarray(har['peaks'], dtype=np.float64)
+    amps  = np.exp(np.asarray(har['vals'], dtype=np.float64))
+    peaks.setflags(write=False)
+    amps.setflags(write=False)
+    return peaks, amps
 
 
 def pianoAdditiveSynth(octave, key, dur, vol):
@@ -260,30 +439,46 @@ def pianoAdditiveSynth(octave, key, dur, vol):
     dur  : duration in seconds (only controls sustain)
     vol  : volume (linear)
     '''
+    return pianoAdditiveSynthBatch([(octave, key, dur, vol)])[0]
 
-    freq, dur, vol = kt4fdv((octave, key, dur, vol))
 
-    freq = freq / 4
+def pianoAdsr(dur):
+    'attack, decay, sustain, release (in samples) of pianoAdditiveSynth'
+    return (iround(0.001 * FS), iround(0.001 * FS), iround(dur * FS),
+            iround(0.2 * FS))
 
-    attack   = iround(0.001 * FS)
-    decay    = iround(0.001 * FS)
-    sustain  = iround(dur   * FS)
-    release  = iround(0.2   * FS)
 
-    combined   = 0
-    for idx, har in enumerate(__pianohar['peaks']):
-        fhar = freq * har       # frequency for the partial
-        if fhar > FS * 0.3:    # respect nyquist
-            break
-        fade = 1.0 + (freq/220) ** 0.5
-        amp  = np.exp(__pianohar['vals'][idx])
-        env  = adsrFadeEnvelope(attack, decay, sustain, release,
-                                sustainAmp=0.7, fade=fade)
-        partial = getSinWav(fhar, len(env), amp=amp) * env
-        combined = combined + partial
-    correction = (110 / freq) ** 0.2
-    ret = combined / abs(combined).max() * 0.5 * vol * correction
-    return F32(ret)
+def pianoAdditiveSynthBatch(notes, out=None, block=16):
+    '''
+    pianoAdditiveSynth for (octave, key, dur, vol) notes of equal dur,
+    one note per row (of out, if given). block notes are rendered
+    together, their envelopes are built in one broadcast call
+    '''
+    fdv   = np.array([ kt4fdv(kt4) for kt4 in notes ], dtype=np.float64)
+    freqs = fdv[:, 0] / 4
+    dur   = fdv[0, 1]
+
+    attack, decay, sustain, release = pianoAdsr(dur)
+
+    peaks, pamps = pianoHarmonics()
+    if out is None:
+        out = np.empty((len(fdv), attack + decay + sustain + release),
+                       dtype=F32)
+    for lo in range(0, len(fdv), block):
+        freq   = freqs[lo:lo+block]
+        fades  = 1.0 + (freq/220) ** 0.5    # same fade for all partials
+        envs   = adsrFadeEnvelope(attack, decay, sustain, release,
+                                  sustainAmp=0.7, fade=fades)
+        fhars  = np.multiply.outer(freq, peaks) # frequency for each partial
+        keep   = fhars <= FS * 0.3              # respect nyquist
+        rows   = partialBankBatch(fhars, np.where(keep, pamps, 0),
+                                  envs.reshape(len(freq), 1, -1),
+                                  out[lo:lo+block])
+        nheads = attack + decay + 2 * np.rint(FS / freq).astype(int)
+        correction = (110 / freq) ** 0.2
+        normalizeRows(rows, nheads,
+                      (0.5, fdv[lo:lo+block, 2], correction))
+    return out
 
 
 def pianoSample(octave, key, dur, vol):
@@ -292,9 +487,7 @@ def pianoSample(octave, key, dur, vol):
     elif pianoSample.type == 2:
         return fmSynth(octave, key, dur, vol)
     key = key.upper()
-    fname = f'samples/piano/{octave}{key}.ogg'
-    audio, rate = sf.read(fname)
-    assert rate == FS
+    audio = sampleBank.load(f'piano/{octave}{key}.ogg')
     audio = applyEnv(audio, dur, vol)
     return audio
 
@@ -302,25 +495,130 @@ def pianoSample(octave, key, dur, vol):
 pianoSample.type = 0
 
 
-__dmap = { 'H' : 'samples/home/',
-           'K' : 'samples/drumkit/' }
+__dmap = { 'H' : 'home',
+           'K' : 'drumkit' }
 
 
 def loadByWavlist(key, dur, vol):
     srcdir = __dmap[key[0]]
     idx = int(key[1:]) # this is the line number
-    with open(f'{srcdir}/wavlist.txt') as fi:
-        lines = [ line.strip() for line in fi ]
-    fname = lines[idx-1]
-    audio, rate = sf.read(f'{srcdir}/{fname}')
-    assert rate == FS
+    audio = sampleBank.byWavlist(srcdir, idx)
     dur   = 4
     audio = applyEnv(audio, dur, vol)
     return F32(audio)
 
 
-@lru_cache(maxsize=None)
+def synthVersion():
+    'hash of the sources that shape a rendered note'
+    srcdir = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+    for fname in ('basicsynth.py', 'oscillator.py', 'envelope.py',
+                  'samplebank.py', 'sustainloop.py', 'piano-harmonics.json'):
+        path = os.path.join(srcdir, fname)
+        if os.path.exists(path):
+            with open(path, 'rb') as fi:
+                digest.update(fi.read())
+    return digest.hexdigest()
+
+
+def useRenderCache(root=DEFAULT_DIR, maxbytes=2 * 2**30):
+    '''
+    keep rendered notes on disk across runs (see rendercache.py). only
+    synthesized pianos (pianoSample.type 1, 2) go through it, recorded
+    notes are assembled from their sustain loop
+    '''
+    sampleSynth.diskCache = RenderCache(root, maxbytes, synthVersion())
+    return sampleSynth.diskCache
+
+
 def sampleSynth(octave, key, dur, vol):
+    '''
+    recorded notes are assembled from one cached SustainLoop per pitch
+    (see sustainloop.py), so any dur and vol reuses it. synthesized
+    pianos (pianoSample.type 1, 2) are cached per note
+    '''
+    if not isRecorded(key):
+        return synthSample(octave, key, dur, vol, pianoSample.type)
+    loop = sampleLoop(octave, key)
+    return loop.render(sampleDur(key, dur), quantize(vol), FS)
+
+
+sampleSynth.diskCache = None
+
+
+def isRecorded(key):
+    'True if sampleSynth plays key from a recording'
+    return key[0] in __dmap or pianoSample.type == 0
+
+
+def sampleDur(key, dur):
+    'dur a recorded sampleSynth key is played with'
+    return quantize(4 if key[0] in __dmap else dur)    # as loadByWavlist
+
+
+def sampleKind(key):
+    '''
+    how sampleSynth makes key: 'loop' (recording), 'piano'
+    (pianoAdditiveSynth), 'fmpiano' (fmSynth) or 'note' (other)
+    '''
+    if isRecorded(key):
+        return 'loop'
+    return { 1: 'piano', 2: 'fmpiano' }.get(pianoSample.type, 'note')
+
+
+def sampleSynthBatch(notes, out):
+    '''
+    sampleSynth for notes of one sampleKind and dur, one per row of out.
+    recorded notes are assembled once per run of equal pitch and only
+    scaled per note, so sort them by pitch. synthesized pianos go to
+    the batch synths (without the note cache)
+    '''
+    kind  = sampleKind(notes[0][1])
+    notes = [ (oc, key[1:] if key[0] == 'P' and kind != 'loop' else key,
+               dur, vol) for oc, key, dur, vol in notes ]
+    if kind == 'piano':
+        return pianoAdditiveSynthBatch(notes, out)
+    if kind == 'fmpiano' and sinOsc.engine != 'exact':
+        return fmSynthBatch(notes, out=out)
+    if kind != 'loop':
+        for row, note in zip(out, notes):
+            row[:] = renderSample(*note)
+        return out
+    pos = 0
+    for (oc, key), run in groupby(notes, key=lambda note: note[:2]):
+        vols = [ quantize(note[3]) for note in run ]
+        loop = sampleLoop(oc, key)
+        loop.renderBatch(sampleDur(key, notes[pos][2]), vols,
+                         out[pos:pos+len(vols)], FS)
+        pos += len(vols)
+    return out
+
+
+@audioCache(sharedCache)
+def sampleLoop(octave, key):
+    'SustainLoop of a recorded sampleSynth key'
+    if key[0] in __dmap:
+        audio = sampleBank.byWavlist(__dmap[key[0]], int(key[1:]))
+    else:
+        key   = key[1:] if key[0] == 'P' else key
+        audio = sampleBank.load(f'piano/{octave}{key.upper()}.ogg')
+    return SustainLoop(audio, int(0.0005 * FS), int(0.2 * FS))
+
+
+@audioCache(sharedCache)
+def synthSample(octave, key, dur, vol, ptype):
+    '''
+    a synthesized sampleSynth note, optionally kept on disk. ptype is
+    pianoSample.type, it is here to be part of the cache key
+    '''
+    disk = sampleSynth.diskCache
+    if disk is None:
+        return renderSample(octave, key, dur, vol)
+    nkey = (ptype, sinOsc.engine, FS, octave, key, dur, vol)
+    return disk.fetch(nkey, lambda: renderSample(octave, key, dur, vol))
+
+
+def renderSample(octave, key, dur, vol):
     if key[0] == 'P':
         ret = pianoSample(octave, key[1:], dur, vol)
     elif key[0] in __dmap:
@@ -335,11 +633,23 @@ def signAbsPow(sig, p=1):
     return sign * abs(sig) ** p
 
 
+def signAbsPowInplace(sig, p, scratch):
+    'signAbsPow for f32 sig, written back into sig (scratch: same shape)'
+    np.abs(sig, out=scratch)
+    np.power(scratch, F32(p), out=scratch)
+    np.copysign(scratch, sig, out=sig)
+    return sig
+
+
+def fmAdsr(dur):
+    'attack, decay, sustain, release (in samples) of fmodulate'
+    return t2s(0.1), t2s(0.05), t2s(dur), t2s(0.3)
+
+
 def fmodulate(fmods, amps, freq, dur):
-    attack  = t2s(0.1)
-    decay   = t2s(0.05)
-    release = t2s(0.3)
-    sustain = t2s(dur)
+    if sinOsc.engine != 'exact':
+        return fmodulateBatch(fmods, amps, [freq], dur, sinOsc.engine)[0]
+    attack, decay, sustain, release = fmAdsr(dur)
     adsr2   = adsrFadeEnvelope(attack, decay, sustain, release, 0.9, 1)
     adsr    = adsrFadeEnvelope(attack, decay, sustain, release, 0.9, 0.1)
     ns      = len(adsr)
@@ -360,27 +670,97 @@ def fmodulate(fmods, amps, freq, dur):
     return np.float32(sig)
 
 
+def fmodulateBatch(fmods, amps, freqs, dur, engine='f32', block=16,
+                   out=None):
+    '''
+    f32 version of fmodulate for many carriers of the same dur.
+    returns a (notes x samples) array (out, if given), one note per
+    freq. phases come from the fixed-point accumulators in oscillator.py,
+    the carrier increment is made in f32 and the whole chain runs in
+    place on scratch buffers allocated once for all blocks.
+    '''
+    attack, decay, sustain, release = fmAdsr(dur)
+    adsr2, adsr = adsrFadeEnvelope(attack, decay, sustain, release, 0.9,
+                                   fade=[1, 0.1])
+    ns      = adsr.shape[0]
+    gain    = 5
+    freqs   = np.asarray(freqs, dtype=np.float64)
+    if out is None:
+        out = np.empty((len(freqs), ns), dtype=F32)
+    shape   = (min(block, len(freqs)), ns)
+    scratch = np.empty(shape, dtype=F32)
+    comp    = np.empty(shape, dtype=F32)
+    modsig  = np.empty(shape, dtype=F32)
+    phase   = np.empty(shape, dtype=np.uint32)
+    for lo in range(0, len(freqs), block):
+        fr  = freqs[lo:lo+block]
+        n   = len(fr)
+        sig = out[lo:lo+n]
+        scr, cmp, mod, ph = scratch[:n], comp[:n], modsig[:n], phase[:n]
+        mod[:] = 0
+        for fm, amp in zip(fmods, amps):
+            phaseRamp(fm * fr, ns, FS, out=ph)
+            sinOsc(ph, engine=engine, out=cmp)
+            signAbsPowInplace(cmp, 0.8, scr)
+            cmp *= F32(amp)
+            mod += cmp
+        mod *= adsr2
+        mod *= F32(gain)
+        # carrier increment fr * (1 + mod) in fixed point: the exact
+        # increment of fr plus the modulation, rounded in f32
+        mod *= F32(fr * (PHASE_ONE / FS))[:, None]
+        np.rint(mod, out=mod)
+        np.copyto(ph.view(np.int32), mod, casting='unsafe')  # mod 2**32
+        ph += phaseInc(fr, FS)[:, None]
+        np.cumsum(ph, axis=1, out=ph)
+        sinOsc(ph, engine=engine, out=sig)
+        signAbsPowInplace(sig, 0.7, scr)
+        sig *= adsr
+    return out
+
+
+FM_MODS = np.array([ 2, 5, 11 ])        # modulator freqs (x carrier)
+FM_AMPS = np.array([ 1, 1, 2 ]) / 4     # modulator weights (sum to 1)
+FM_HEAD = sum(fmAdsr(0)[:2])           # attack + decay of fmodulate
+
+
 def fmSynth(octave, key, dur, vol):
 
     freq, dur, vol = kt4fdv((octave, key, dur, vol))
 
     freq = freq / 8
 
-    AR    = np.array
-
-    fmods = AR([ 2, 5, 11 ])
-    amps  = AR([ 1, 1, 2 ])
-    amps  = amps / amps.sum()
-
-    ret = fmodulate(fmods, amps, freq, dur)
+    ret = fmodulate(FM_MODS, FM_AMPS, freq, dur)
 
     correction = (110 / freq) ** 0.1
-    ret = ret/ abs(ret).max() * vol * correction
+    ret = ret/ headPeak(ret, FM_HEAD + 2 * iround(FS / freq)) * vol * correction
 
     return ret
 
 
+def fmSynthBatch(notes, engine=None, out=None):
+    '''
+    fmSynth for a list of (octave, key, dur, vol) of equal dur, one per
+    row (of out, if given). engine defaults to sinOsc.engine, 'exact'
+    renders note by note with fmSynth (as fmodulate does)
+    '''
+    engine = engine or sinOsc.engine
+    if engine == 'exact':
+        rows = [ fmSynth(*note) for note in notes ]
+        if out is None:
+            return np.array(rows, dtype=F32)
+        out[:] = rows
+        return out
+    fdv   = np.array([ kt4fdv(kt4) for kt4 in notes ], dtype=np.float64)
+    freqs = fdv[:, 0] / 8
+    ret   = fmodulateBatch(FM_MODS, FM_AMPS, freqs, fdv[0, 1], engine,
+                           out=out)
+    nhead = FM_HEAD + 2 * np.rint(FS / freqs).astype(int)
+    return normalizeRows(ret, nhead, (fdv[:, 2], (110 / freqs) ** 0.1))
+
+
 def testSampleSynth():
+    from matplotlib import pyplot as plt
     #data = sampleSynth(6, 'a', 2, 0)
     #data = sampleSynth(6, 'H4', 2, 0)
     data = fmSynth(220, 1, 1)
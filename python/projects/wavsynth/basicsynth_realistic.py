@@ -36,6 +36,10 @@ import numpy as np
 from scipy.io import wavfile
 from matplotlib import pyplot as plt
 import random
+from functools import lru_cache
+
+from oscillator import sinOsc, phaseRamp
+from envelope import adsrFadeEnvelopes
 
 
 FS  = 48000         # project sampling rate
@@ -47,6 +51,9 @@ def iround(x):
 
 
 def getSinWav(freq, nsamp, amp=0.2):
+    if sinOsc.engine != 'exact':    # see oscillator.py
+        phase, _ = phaseRamp(freq, nsamp, FS)
+        return sinOsc(phase, amp)
     tx    = np.arange(nsamp)
 
     phase = 0
@@ -99,12 +106,9 @@ def adsrEnvelope(attack, decay, sustain, release, sustainAmp=0.4):
     return F32(env)
 
 
-def adsrFadeEnvelope(attack, decay, sustain, release, sustainAmp=0.4, fade=4):
-    '''
-    similar to adsr, but with slow exponential decay during sustain.
-    this captures behavior of a plucked string
-    '''
-
+@lru_cache(maxsize=16)
+def sustainModulator(sustain):
+    'amplitude modulation for the sustain part (only depends on its length)'
     t = np.arange(sustain) / FS
     f_mod = 2
     mod_strength = 0.08
@@ -112,15 +116,20 @@ def adsrFadeEnvelope(attack, decay, sustain, release, sustainAmp=0.4, fade=4):
     # Amplitude modulation to be applied to the sustain part. Modulation strength decreases over time.
     modulator = 1 + mod_strength * np.linspace(1, 0.2, sustain) * \
                 np.sin(2 * np.pi * f_mod * t)
+    modulator = F32(modulator)
+    modulator.setflags(write=False)
+    return modulator
 
-    env = [
-        np.linspace(0, 1, attack),
-        np.linspace(1, sustainAmp, decay),
-        np.exp(-np.linspace(0, fade, sustain)) * sustainAmp * modulator,
-        np.linspace(np.exp(-fade) * sustainAmp, 0, release)
-    ]
-    env = np.hstack(env)
-    return F32(env)
+
+def adsrFadeEnvelope(attack, decay, sustain, release, sustainAmp=0.4, fade=4):
+    '''
+    similar to adsr, but with slow exponential decay during sustain.
+    this captures behavior of a plucked string
+    (a vector of fades gives all envelopes at once, one per row)
+    '''
+    env = adsrFadeEnvelopes(attack, decay, sustain, release, sustainAmp, fade)
+    env[..., attack+decay:attack+decay+sustain] *= sustainModulator(sustain)
+    return env
 
 
 def seqManySinWavsWithEnv():
@@ -167,12 +176,24 @@ def get_overtone_amplitudes():
 
 
 
-def additiveSynth(freq, dur, vol):
+def noteRng(seed, index):
+    '''
+    random generator of note event index in a score with seed.
+    it is the stream SeedSequence(seed).spawn(n)[index] would give, but
+    without spawning the others, so events can be rendered in any order
+    '''
+    ss = np.random.SeedSequence(seed, spawn_key=(index,))
+    return np.random.Generator(np.random.PCG64(ss))
+
+
+def additiveSynth(freq, dur, vol, rng=None):
     '''
     returns a synthesized sound by adding several partials
     freq : frequency of fundamental (in Hz)
     dur  : duration in seconds (only controls sustain)
     vol  : volume (linear)
+    rng  : numpy Generator of the note (see noteRng), None uses the
+           global random module in call order
     '''
 
     # Strength of the random variation for volume and frequency (set to 0 for no variation),
@@ -191,29 +212,32 @@ def additiveSynth(freq, dur, vol):
     harlim   = len(har_amps)
 
 
+    gauss = random.gauss if rng is None else rng.normal
+
     # Random variation in volume
-    vol *= 1 + random.gauss(0, rand_vol)
+    vol *= 1 + gauss(0, rand_vol)
 
     # Random increases in frequency simulate accidental bendings of strings:
-    freq_factor = 1 + abs(random.gauss(0, rand_freq))
+    freq_factor = 1 + abs(gauss(0, rand_freq))
     
     # attenuate overtones depending on volume
     har_amps *= np.logspace(0, np.log10(vol + 1e-10), harlim)
 
-    combined   = 0
-
-    for har in range(1, harlim, harjump):
+    hars  = np.arange(1, harlim, harjump)
+    fhars = freq * hars * freq_factor  # frequency for each partial
+    over  = np.flatnonzero(fhars > FS * 0.4)  # respect nyquist
+    if len(over):
+        hars, fhars = hars[:over[0]], fhars[:over[0]]
+    fades = 2.5 + 0.4 * hars      # fade depends on the partial har
+    # amp  = (har+2) ** -2.5    # amplitude depends on partial har
 
-        fhar = freq * har * freq_factor  # frequency for the partial
-        if fhar > FS * 0.4:      # respect nyquist
-            break
-        fade = 2.5 + 0.4 * har      # fade depends on the partial har
-        # amp  = (har+2) ** -2.5    # amplitude depends on partial har
+    envs  = adsrFadeEnvelope(attack, decay, sustain, release,
+                             sustainAmp=0.8, fade=fades)
 
-        env  = adsrFadeEnvelope(attack, decay, sustain, release,
-                                sustainAmp=0.8, fade=fade)
+    combined   = 0
 
-        partial = getSinWav(fhar, len(env), amp=har_amps[har-1]) * env
+    for idx, har in enumerate(hars):
+        partial = getSinWav(fhars[idx], envs.shape[1], amp=har_amps[har-1]) * envs[idx]
         combined = combined + partial
     correction = (110 / freq) ** 0.4
     ret = combined / abs(combined).max() * 0.5 * vol * correction
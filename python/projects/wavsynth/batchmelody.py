@@ -0,0 +1,127 @@
+'''
+batch melody generation.
+
+the functions in basicmelody.py make one melody per call. the versions
+here make n of them at once, one per row of a 2-d array:
+  pickHitPointsBatch  : (n, patlen) int32 hits, nhit ones per row
+  hitSomeMoreBatch    : the hits with nhit more ones per row
+  toneCurveBatch      : (n, patlen) smoothed tone curves in [0, 1]
+  assembleMelodyBatch : (n, patlen) key indices, -1 where there is no hit
+each row has the same distribution as the single melody function. they
+draw from a numpy Generator (rng: a Generator or a seed), so a batch is
+reproducible from its seed.
+'''
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import basicmelody as bmel
+
+
+def getRng(rng=None):
+    'a Generator from a seed (or None), Generators are passed through'
+    if isinstance(rng, np.random.Generator):
+        return rng
+    return np.random.default_rng(rng)
+
+
+def pickHitPointsBatch(n, patlen=16, nhit=8, rng=None):
+    'n rows of pickHitPoints(patlen, nhit)'
+    rng  = getRng(rng)
+    hits = np.zeros((n, patlen), dtype=np.int32)
+    hits[:, :nhit] = 1
+    return rng.permuted(hits, axis=1)
+
+
+def hitSomeMoreBatch(hits, nhit=1, rng=None):
+    'hitSomeMore for every row: nhit more hits at random free points'
+    rng   = getRng(rng)
+    hits  = np.array(hits, dtype=np.int32)
+    keys  = rng.random(hits.shape)
+    keys[hits != 0] = np.inf          # taken points sort last
+    pick  = np.argsort(keys, axis=1)[:, :nhit]
+    rows  = np.arange(len(hits))[:, None]
+    free  = np.isfinite(keys[rows, pick])
+    hits[rows, pick] = np.where(free, 1, hits[rows, pick])
+    return hits
+
+
+def hitFamilyProgBatch(n, patlen=16, start=7, step=1, count=6, rng=None):
+    'hitFamilyProg for n rows, as a (count+1, n, patlen) array'
+    rng  = getRng(rng)
+    hits = pickHitPointsBatch(n, patlen, start, rng)
+    ret  = [ hits ]
+    for ii in range(count):
+        hits = hitSomeMoreBatch(hits, step, rng)
+        ret.append(hits)
+    return np.stack(ret)
+
+
+def norm01Rows(vec):
+    'norm01 for every row'
+    vec -= vec.min(axis=1, keepdims=True)
+    vec /= vec.max(axis=1, keepdims=True)
+    return vec
+
+
+def toneCurveBatch(n, patlen=16, wlen=8, incli=0, rng=None):
+    '''
+    n rows of toneCurve(patlen, wlen, incli). the hamming smoothing
+    is one matrix product over sliding windows of all rows
+    '''
+    rng   = getRng(rng)
+    nsize = patlen
+    if wlen > 1:
+        nsize += 2 * wlen
+    noise = rng.random((n, nsize))
+    if incli != 0:
+        noise += np.linspace(0, incli, nsize)
+    if wlen > 1:
+        # np.convolve(.., 'same')[wlen:-wlen] is a plain correlation with
+        # the reversed window starting at this offset
+        win   = np.hamming(wlen)[::-1]
+        start = (wlen - 1) // 2 + 1
+        wins  = sliding_window_view(noise, wlen, axis=1)
+        noise = wins[:, start:start+patlen] @ win
+    return norm01Rows(noise)
+
+
+def assembleMelodyBatch(nkeys, hits, curves, rng=None):
+    '''
+    assembleMelody for every row, as indices into the nkeys keys (-1:
+    no hit). keydither is applied when keydither.enabled is set
+    '''
+    toneidx = np.int32(curves * (nkeys - 0.01))
+    ret     = np.where(hits == 1, toneidx, -1).astype(np.int32)
+    if not bmel.keydither.enabled:
+        return ret
+    rng  = getRng(rng)
+    prev = np.full(len(ret), -1)
+    for col in range(ret.shape[1]):     # dither depends on the last hit
+        idx  = ret[:, col]
+        same = (idx >= 0) & (idx == prev)
+        lo   = np.where(idx > 0, -1, 0)
+        hi   = np.where(idx < nkeys - 1, 1, 0)
+        step = rng.integers(lo, hi + 1)
+        idx  = np.where(same, idx + step, idx)
+        ret[:, col] = idx
+        prev = np.where(idx >= 0, idx, prev)
+    return ret
+
+
+def keyRows(keys, keyidx):
+    'key index rows -> lists like assembleMelody returns (None: no hit)'
+    table = np.array(list(keys) + [ None ], dtype=object)
+    return table[keyidx].tolist()     # -1 picks the trailing None
+
+
+def melodyBatch(n, keys, patlen=16, nhit=8, wlen=10, incli=0, rng=None):
+    '''
+    n melodies from keys in one shot
+    returns (hits, curves, keyidx), all (n, patlen)
+    '''
+    rng    = getRng(rng)
+    hits   = pickHitPointsBatch(n, patlen, nhit, rng)
+    curves = toneCurveBatch(n, patlen, wlen, incli, rng)
+    keyidx = assembleMelodyBatch(len(keys), hits, curves, rng)
+    return hits, curves, keyidx
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+'''
+synthesis benchmarks.
+
+sweeps synth type, note count, note duration and partial count, and
+times the mixers (sequenceDirect, pat2wav). every case reports
+  time  : best wall time of the repeats (s)
+  sps   : output samples per second
+  rtf   : real-time factor, wall time / audio duration (< 1 is faster
+          than real time)
+  peak  : peak traced memory of one run (MiB, tracemalloc)
+synth/fm-batch renders the notes of synth/fm in one batch, compare the
+two with the engine the batch is made for (--engine f32).
+results are stored as json, and a run can be compared against a saved
+baseline:
+  ./benchsynth.py --save base.json
+  ./benchsynth.py --baseline base.json
+the waveform cache is cleared before every run, so notes are rendered
+cold. cases that need missing data (e.g. piano-harmonics.json) are
+skipped.
+'''
+
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import numpy as np
+
+import basicsynth as bsynth
+import basicmelody as bmel
+import basicsequencer as bseq
+from basicsynth import FS
+from noterender import renderNotes
+
+KEYS   = 'c d e f g a b'.split()
+SYNTHS = { 'additive' : lambda oc, k, d, v: bsynth.additiveSynth(
+                            bsynth.kt4fdv((oc, k, d, v))[0], d, 1),
+           'fm'       : bsynth.fmSynth,
+           'piano'    : bsynth.pianoAdditiveSynth,
+           'sample'   : bsynth.sampleSynth }
+
+
+def noteList(n, dur):
+    'n different notes (so nothing is served from the cache)'
+    return [ (2 + idx // len(KEYS) % 3, KEYS[idx % len(KEYS)],
+              dur * (1 + idx // 21 * 1e-3), 0) for idx in range(n) ]
+
+
+def timeit(func, repeat=3):
+    '''
+    run func repeat times (cold cache), returns (best time, peak MiB,
+    number of samples of its output)
+    '''
+    best = float('inf')
+    for _ in range(repeat):
+        bsynth.sharedCache.clear()
+        t0   = time.perf_counter()
+        out  = func()
+        best = min(best, time.perf_counter() - t0)
+    bsynth.sharedCache.clear()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    nsamp = sum(len(x) for x in out) if isinstance(out, list) else len(out)
+    return best, peak, nsamp
+
+
+def benchCase(func, repeat=3):
+    'timing dict of one case, or the reason why it was skipped'
+    try:
+        best, peak, nsamp = timeit(func, repeat)
+    except (OSError, KeyError) as err:     # missing samples / harmonics
+        return dict(skipped=f'{type(err).__name__}: {err}')
+    return dict(time=best, sps=nsamp / best, rtf=best / (nsamp / FS),
+                peak=peak, nsamp=nsamp)
+
+
+def cases(quick=False):
+    'yields (name, func) for the whole sweep'
+    durs    = [ 0.25, 1 ] if quick else [ 0.25, 1, 4 ]
+    counts  = [ 1, 8 ] if quick else [ 1, 8, 32 ]
+    partials = [ 8, 32 ] if quick else [ 4, 8, 16, 32, 64 ]
+    for name, synth in SYNTHS.items():
+        for dur in durs:
+            for n in counts:
+                notes = noteList(n, dur)
+                yield (f'synth/{name}/dur={dur}/notes={n}',
+                       lambda s=synth, ns=notes: [ s(*note) for note in ns ])
+    # fmSynthBatch (through renderNotes) against one fmSynth per note
+    for dur in durs:
+        for n in counts:
+            notes = noteList(n, dur)
+            yield (f'synth/fm-batch/dur={dur}/notes={n}',
+                   lambda ns=notes: renderNotes(ns, 'fm')[0])
+    env = bsynth.adsrFadeEnvelope(144, 1440, FS, 960, 0.8, 4)
+    for npart in partials:
+        fhars = 55 * np.arange(1, npart + 1)
+        amps  = (np.arange(1, npart + 1) + 2.0) ** -2.5
+        yield (f'partials/{npart}',
+               lambda f=fhars, a=amps: bsynth.partialBank(f, a, env))
+    vec = bsynth.additiveSynth(220, 1, 1)
+    for n in counts:
+        steps = 10 * n
+        llvec = [ [ vec ] for _ in range(steps) ]
+        yield (f'sequenceDirect/steps={steps}',
+               lambda ll=llvec: bseq.sequenceDirect(ll, 8000))
+        pat   = [ [ (2, KEYS[idx % 7], 1, 0) ] for idx in range(steps) ]
+        yield (f'pat2wav/steps={steps}',
+               lambda p=pat: bmel.pat2wav(p, 8000))
+    # a long score: 10k events, 10 per frame
+    llvec = [ [ vec ] * 10 for _ in range(1000) ]
+    yield ('sequenceDirect/events=10000',
+           lambda ll=llvec: bseq.sequenceDirect(ll, 2400))
+
+
+def runAll(quick=False, repeat=3, match=''):
+    'runs the sweep, returns a json friendly dict'
+    results = {}
+    for name, func in cases(quick):
+        if match not in name:
+            continue
+        results[name] = res = benchCase(func, repeat)
+        if 'skipped' in res:
+            print(f'{name:40s} skipped ({res["skipped"]})')
+        else:
+            print(f'{name:40s} {res["time"]*1e3:9.2f} ms '
+                  f'{res["sps"]/1e6:8.2f} Msps  rtf {res["rtf"]:.4f} '
+                  f'peak {res["peak"]:7.1f} MiB')
+    meta = dict(python=platform.python_version(), numpy=np.__version__,
+                machine=platform.machine(), engine=bsynth.sinOsc.engine,
+                ptype=bsynth.pianoSample.type, date=time.strftime('%F %T'))
+    return dict(meta=meta, results=results)
+
+
+def compareRuns(base, run, tolerance=0.1):
+    '''
+    compares the times of run against base (both runAll dicts).
+    returns the names of the cases that got slower by more than tolerance
+    '''
+    slower = []
+    for name, res in run['results'].items():
+        ref = base['results'].get(name)
+        if ref is None or 'time' not in ref or 'time' not in res:
+            continue
+        ratio = res['time'] / ref['time']
+        flag  = ''
+        if ratio > 1 + tolerance:
+            flag = '  SLOWER'
+            slower.append(name)
+        elif ratio < 1 - tolerance:
+            flag = '  faster'
+        print(f'{name:40s} {ref["time"]*1e3:9.2f} -> {res["time"]*1e3:9.2f} ms'
+              f'  x{ratio:.2f}{flag}')
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='wavsynth benchmarks')
+    parser.add_argument('--quick', action='store_true', help='smaller sweep')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--match', default='', help='only cases containing this')
+    parser.add_argument('--engine', default=None, help='oscillator engine')
+    parser.add_argument('--save', help='write results to this json file')
+    parser.add_argument('--baseline', help='compare against this json file')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+    if args.engine:
+        bsynth.setOscEngine(args.engine)
+    run = runAll(args.quick, args.repeat, args.match)
+    if args.save:
+        with open(args.save, 'w') as fo:
+            json.dump(run, fo, indent=1)
+    if args.baseline:
+        with open(args.baseline) as fi:
+            base = json.load(fi)
+        slower = compareRuns(base, run, args.tolerance)
+        if slower:
+            print(f'{len(slower)} case(s) slower than the baseline')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
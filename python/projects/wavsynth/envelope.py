@@ -0,0 +1,72 @@
+'''
+closed-form adsr envelopes.
+
+FadeEnvelope describes adsrFadeEnvelope without building it. indexing
+with a slice (env[start:stop]) evaluates only that sample range, so a
+block renderer never needs the full array. sustainAmp and fade may be
+vectors: a family of envelopes is then evaluated in one broadcast op
+and indexing returns a (envelopes x samples) array.
+'''
+
+import numpy as np
+
+F32 = np.float32
+
+
+class FadeEnvelope:
+    'lazy adsrFadeEnvelope (attack, decay, fading sustain, release)'
+
+    def __init__(self, attack, decay, sustain, release, sustainAmp=0.4, fade=4):
+        sa, fade = np.broadcast_arrays(np.asarray(sustainAmp, dtype=np.float64),
+                                       np.asarray(fade, dtype=np.float64))
+        self.shape  = sa.shape
+        self.sa     = sa[..., None]
+        self.bounds = np.cumsum([0, attack, decay, sustain, release])
+        # (first, last) value of each linear segment. the sustain segment
+        # is linear in the exponent: exp(-x) * sustainAmp
+        self.segs   = [ (0.0, 1.0),
+                        (1.0, self.sa),
+                        (0.0, fade[..., None]),
+                        (np.exp(-fade[..., None]) * self.sa, 0.0) ]
+
+    def __len__(self):
+        return int(self.bounds[-1])
+
+    def __getitem__(self, sl):
+        start, stop, step = sl.indices(len(self))
+        assert step == 1, 'only contiguous ranges are supported'
+        out = np.zeros(self.shape + (max(stop - start, 0),), dtype=F32)
+        for sid, (first, last) in enumerate(self.segs):
+            lo, hi = self.bounds[sid], self.bounds[sid+1]
+            s0, s1 = max(start, lo), min(stop, hi)
+            if s0 >= s1:
+                continue
+            val = self.linseg(first, last, hi - lo, s0 - lo, s1 - lo)
+            if sid == 2:
+                val = np.exp(-val) * self.sa
+            out[..., s0-start:s1-start] = val
+        return out
+
+    @staticmethod
+    def linseg(first, last, num, j0, j1):
+        'np.linspace(first, last, num)[j0:j1], same rounding as linspace'
+        jj  = np.arange(j0, j1, dtype=np.float64)
+        if num > 1:
+            val = jj * ((last - first) / (num - 1)) + first
+        else:
+            val = jj * 0 + first
+        if j1 == num and num > 1:
+            val[..., -1] = last if np.ndim(last) == 0 else last[..., 0]
+        return val
+
+    def render(self):
+        'the whole envelope (or family of envelopes)'
+        return self[:]
+
+
+def adsrFadeEnvelopes(attack, decay, sustain, release, sustainAmp=0.4, fade=4):
+    '''
+    adsrFadeEnvelope for vectors of sustainAmp / fade.
+    returns (envelopes x samples) f32, or 1d for scalar params
+    '''
+    return FadeEnvelope(attack, decay, sustain, release, sustainAmp, fade).render()
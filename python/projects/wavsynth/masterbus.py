@@ -0,0 +1,112 @@
+'''
+master bus: lookahead peak limiter and loudness normalization.
+
+the mix is no longer kept in range by normalizing every note to its
+max. instead the summed signal goes through a Limiter, block by block:
+  required gain  g[n] = min(1, threshold / |x[n]|)
+  held gain      m[n] = min of g over the lookahead plus hold window
+  applied gain   G[n] = mean of m over the lookahead window
+the output is delayed by the lookahead, so G has come down before a
+peak arrives (every window that is averaged contains the peak), and it
+comes back up over hold + lookahead afterwards. where no sample is
+close to the threshold the gain is exactly 1, so quiet mixes pass
+through unchanged. everything is vectorized per block; the state
+between blocks is a short history of the input and of g.
+'''
+
+import numpy as np
+from scipy.ndimage import minimum_filter1d
+
+from basicsynth import FS, F32
+
+
+class Limiter:
+    '''
+    streaming lookahead peak limiter
+    threshold : output peak
+    lookahead : seconds, also the latency of process()
+    hold      : seconds the gain is held after a peak before it releases
+    '''
+
+    def __init__(self, threshold=0.99, lookahead=0.005, hold=0.05, fs=FS):
+        self.threshold = threshold
+        self.look  = max(int(lookahead * fs), 1)
+        self.hold  = int(hold * fs)
+        win        = self.look + self.hold + 1
+        self.xhist = np.zeros(self.look, dtype=F32)     # delay line
+        self.ghist = np.ones(win - 1)                   # g of past samples
+        self.mhist = np.ones(self.look - 1)             # m of past samples
+        self.reduction = 1.0                            # smallest gain so far
+
+    def gains(self, x):
+        'applied gain of the samples delayed by the lookahead'
+        g = np.ones(len(x))
+        over = np.abs(x) > self.threshold
+        g[over] = self.threshold / np.abs(x[over])
+        g = np.concatenate((self.ghist, g))
+        self.ghist = g[len(g)-len(self.ghist):]
+        # trailing window min: m[n] = min(g[n-win+1 .. n])
+        win = self.look + self.hold + 1
+        m   = minimum_filter1d(g, win, origin=(win - 1) // 2)[win-1:]
+        m   = np.concatenate((self.mhist, m))
+        self.mhist = m[len(m)-len(self.mhist):] if len(self.mhist) else m[:0]
+        # trailing mean over look samples, exactly 1 where m is all 1
+        csum  = np.concatenate(([ 0 ], np.cumsum(m)))
+        gain  = (csum[self.look:] - csum[:-self.look]) / self.look
+        quiet = minimum_filter1d(m, self.look,
+                                 origin=(self.look - 1) // 2)[self.look-1:]
+        gain[quiet == 1] = 1
+        return gain
+
+    def process(self, block):
+        'limit a block, returns the same number of samples (delayed)'
+        block = np.asarray(block, dtype=F32)
+        if not len(block):
+            return block
+        gain  = self.gains(block)
+        x     = np.concatenate((self.xhist, block))
+        self.xhist = x[len(block):]
+        self.reduction = min(self.reduction, float(gain.min()))
+        out   = x[:len(block)] * gain.astype(F32)
+        return out
+
+    def flush(self):
+        'the lookahead samples still in the delay line'
+        return self.process(np.zeros(self.look, dtype=F32))
+
+
+def loudnessGain(music, target=-16.0):
+    'gain that brings the rms of music to target dB (full scale)'
+    rms = float(np.sqrt(np.mean(np.square(music, dtype=np.float64))))
+    return 1.0 if rms == 0 else 10 ** (target / 20) / rms
+
+
+def streamMaster(blocks, gain=1.0, limiter=None):
+    '''
+    master bus for a stream of blocks: gain, then the limiter. the
+    limiter latency is removed, the output has the length of the input
+    '''
+    limiter = limiter or Limiter()
+    skip    = limiter.look
+    for block in blocks:
+        out = limiter.process(block * F32(gain))
+        if skip:
+            drop  = min(skip, len(out))
+            out   = out[drop:]
+            skip -= drop
+        if len(out):
+            yield out
+    out = limiter.flush()
+    yield out[skip:]
+
+
+def master(music, gain=1.0, loudness=None, limiter=None, blocksize=65536):
+    '''
+    master bus for a whole mix
+    loudness : normalize to this rms (dB full scale) before limiting
+    '''
+    if loudness is not None:
+        gain *= loudnessGain(music, loudness)
+    blocks = (music[lo:lo+blocksize] for lo in range(0, len(music), blocksize))
+    parts  = list(streamMaster(blocks, gain, limiter))
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=F32)
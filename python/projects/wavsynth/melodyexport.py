@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+'''
+melody dataset export.
+
+generates count melodies (see batchmelody.py), renders them with
+pat2wav in a process pool and writes them in shards:
+  out/config.json              the settings of the dataset
+  out/shard-00000/00000000.flac  one file per melody (--format flac)
+  out/shard-00000.npz          or all audio of a shard, ragged (npz)
+  out/shard-00000.json         manifest of the shard, written last
+  out/manifest.jsonl           all items, once every shard is done
+every item has its own seed, derived from (dataset seed, item index),
+and the manifest keeps its seed, keys, hits and curve (and the gain, a
+melody that would clip is scaled to a peak of 0.99). a shard counts as
+done once its manifest exists, so an interrupted export resumes with
+the remaining shards:
+  ./melodyexport.py out --count 10000 --workers 8
+'''
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import basicsynth as bsynth
+import basicmelody as bmel
+import batchmelody
+import wavstream
+from basicsynth import FS
+
+CONFIG_KEYS = ( 'count', 'shard', 'format', 'seed', 'keys', 'patlen',
+                'nhit', 'wlen', 'incli', 'tstep', 'silence', 'background',
+                'ptype' )
+
+
+def itemSeed(seed, index):
+    'seed of item index of a dataset with seed'
+    ss = np.random.SeedSequence(seed, spawn_key=(index,))
+    return int(ss.generate_state(1, np.uint64)[0])
+
+
+def makeItem(index, cfg):
+    'melody number index: (manifest entry, pattern)'
+    seed = itemSeed(cfg['seed'], index)
+    keys = cfg['keys'].split()
+    hits, curve, keyidx = batchmelody.melodyBatch(
+            1, keys, cfg['patlen'], cfg['nhit'], cfg['wlen'], cfg['incli'],
+            rng=seed)
+    mel = bmel.expandKeypat(batchmelody.keyRows(keys, keyidx)[0])
+    mel = bmel.attachSilence(mel, cfg['silence'], cfg['silence'])
+    if cfg['background']:
+        mel = bmel.addBackground(mel, cfg['background'])
+    item = dict(index=index, seed=seed, keys=keys, hits=hits[0].tolist(),
+                curve=np.round(curve[0], 6).tolist())
+    return item, mel
+
+
+def writeJson(path, obj):
+    'atomic json write (a half written manifest never marks a shard done)'
+    tmp = f'{path}.tmp{os.getpid()}'
+    with open(tmp, 'w') as fo:
+        json.dump(obj, fo)
+    os.replace(tmp, path)
+
+
+def shardName(out, shard):
+    return os.path.join(out, f'shard-{shard:05d}')
+
+
+def exportShard(shard, cfg, out):
+    'render and write one shard, returns its number of items'
+    bsynth.pianoSample.type = cfg['ptype']
+    lo    = shard * cfg['shard']
+    hi    = min(lo + cfg['shard'], cfg['count'])
+    base  = shardName(out, shard)
+    items, audio = [], []
+    for index in range(lo, hi):
+        item, mel = makeItem(index, cfg)
+        music = bmel.pat2wav(mel, cfg['tstep'])
+        peak  = float(abs(music).max(initial=0))
+        item['gain']  = 1.0 if peak < 1 else 0.99 / peak  # flac would clip
+        item['nsamp'] = len(music)
+        music *= np.float32(item['gain'])
+        if cfg['format'] == 'flac':
+            os.makedirs(base, exist_ok=True)
+            item['file'] = os.path.join(os.path.basename(base),
+                                        f'{index:08d}.flac')
+            wavstream.writeStream(os.path.join(out, item['file']),
+                                  [ music ], FS)
+        else:
+            audio.append(music)
+        items.append(item)
+    if cfg['format'] == 'npz':
+        offsets = np.cumsum([ 0 ] + [ len(a) for a in audio ])
+        tmp = f'{base}.tmp{os.getpid()}.npz'
+        np.savez(tmp, audio=np.concatenate(audio) if audio else np.zeros(0),
+                 offsets=offsets, index=np.arange(lo, hi))
+        os.replace(tmp, f'{base}.npz')
+        for pos, item in enumerate(items):
+            item['file'] = os.path.basename(base) + '.npz'
+            item['row']  = pos
+    writeJson(f'{base}.json', dict(shard=shard, items=items))
+    return len(items)
+
+
+def loadConfig(out, cfg):
+    'writes the config of a new export, checks it when resuming'
+    path = os.path.join(out, 'config.json')
+    if os.path.exists(path):
+        with open(path) as fi:
+            old = json.load(fi)
+        if old != cfg:
+            diff = [ k for k in CONFIG_KEYS if old.get(k) != cfg.get(k) ]
+            raise ValueError(f'{out} holds an export with other settings '
+                             f'({", ".join(diff)})')
+        return
+    os.makedirs(out, exist_ok=True)
+    writeJson(path, cfg)
+
+
+def export(out, cfg, workers=None):
+    'export (or resume) the dataset described by cfg into out'
+    loadConfig(out, cfg)
+    nshard  = -(-cfg['count'] // cfg['shard'])
+    pending = [ shard for shard in range(nshard)
+                if not os.path.exists(shardName(out, shard) + '.json') ]
+    print(f'{nshard - len(pending)} of {nshard} shards done')
+    if workers == 1:
+        for shard in pending:
+            exportShard(shard, cfg, out)
+            print(f'shard {shard} done')
+    elif pending:
+        with ProcessPoolExecutor(workers) as pool:
+            jobs = { pool.submit(exportShard, shard, cfg, out): shard
+                     for shard in pending }
+            for job in as_completed(jobs):
+                job.result()
+                print(f'shard {jobs[job]} done')
+    with open(os.path.join(out, 'manifest.jsonl.tmp'), 'w') as fo:
+        for shard in range(nshard):
+            with open(shardName(out, shard) + '.json') as fi:
+                for item in json.load(fi)['items']:
+                    fo.write(json.dumps(item) + '\n')
+    os.replace(os.path.join(out, 'manifest.jsonl.tmp'),
+               os.path.join(out, 'manifest.jsonl'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='export a melody dataset')
+    parser.add_argument('out', help='output directory')
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--shard', type=int, default=100, help='items per shard')
+    parser.add_argument('--format', choices=('flac', 'npz'), default='flac')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keys', default='5c 5d 5e 5f')
+    parser.add_argument('--patlen', type=int, default=16)
+    parser.add_argument('--nhit', type=int, default=7)
+    parser.add_argument('--wlen', type=int, default=10)
+    parser.add_argument('--incli', type=float, default=0)
+    parser.add_argument('--tstep', type=int, default=8000)
+    parser.add_argument('--silence', type=int, default=4)
+    parser.add_argument('--background', default='7c - 2c - 6c 2c - 6d')
+    parser.add_argument('--ptype', type=int, default=0, help='pianoSample.type')
+    args = parser.parse_args()
+    cfg  = { key: getattr(args, key) for key in CONFIG_KEYS }
+    try:
+        export(args.out, cfg, args.workers)
+    except ValueError as err:
+        sys.exit(str(err))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+'''
+single pass placement mixer.
+
+every event is an (onset, buffer) pair, with an optional per event gain.
+the output length is known from the events up front, so each buffer is
+added exactly once, in place, into one preallocated f32 output.
+'''
+
+import numpy as np
+
+F32 = np.float32
+
+
+def lagrangeKernel(frac, order=3):
+    '''
+    fractional delay filter (lagrange interpolation, odd order)
+    returns (taps, latency): the taps delay by latency + frac samples
+    '''
+    latency = (order - 1) // 2
+    delay   = latency + frac
+    taps    = np.ones(order + 1)
+    for k in range(order + 1):
+        for m in range(order + 1):
+            if m != k:
+                taps[k] *= (delay - m) / (k - m)
+    return taps, latency
+
+
+def mixEvents(onsets, bufs, gains=None, length=None, order=None):
+    '''
+    onsets : onset of each event (in samples, may be fractional)
+    bufs   : audio of each event
+    gains  : optional gain of each event
+    length : output length (default: end of the last event)
+    order  : None places each event at floor(onset), an odd order (1:
+             linear, 3: cubic) places it with sub-sample accuracy through
+             a lagrange fractional delay kernel (see lagrangeKernel)
+    '''
+    onsets = np.asarray(onsets)
+    starts = np.floor(onsets).astype(np.int64)
+    lens   = np.array([ len(buf) for buf in bufs ], dtype=np.int64)
+    if length is None:
+        extra  = 0 if order is None else order - (order - 1) // 2
+        length = (starts + lens).max() + extra if len(bufs) else 0
+    out = np.zeros(length, dtype=F32)
+    scratch = np.empty(lens.max() if len(bufs) else 0, dtype=F32)
+    for idx, buf in enumerate(bufs):
+        on, n = starts[idx], lens[idx]
+        gain  = 1 if gains is None else gains[idx]
+        if order is None:
+            seg = out[on:on+n]
+            if gain == 1:
+                seg += buf
+            else:
+                tmp = np.multiply(buf, gain, out=scratch[:n], casting='unsafe')
+                seg += tmp
+            continue
+        taps, latency = lagrangeKernel(onsets[idx] - on, order)
+        for k, tap in enumerate(taps):      # one shifted add per tap
+            pos = on - latency + k
+            lo  = max(-pos, 0)              # clip at both ends of out
+            hi  = min(n, length - pos)
+            if hi <= lo:
+                continue
+            tmp = np.multiply(buf[lo:hi], gain * tap, out=scratch[:hi-lo],
+                              casting='unsafe')
+            out[pos+lo:pos+hi] += tmp
+    return out
+
+
+def mixRagged(onsets, ids, buf, starts, lens, gains=None, length=None):
+    '''
+    mixEvents for notes packed in a ragged buffer (see noterender.py)
+    ids : note index of each event, the note is
+          buf[starts[id]:starts[id]+lens[id]]
+    '''
+    views = [ buf[start:start+n] for start, n in zip(starts, lens) ]
+    bufs  = [ views[nid] for nid in ids ]
+    return mixEvents(onsets, bufs, gains, length)
+
+
+def sequenceFrames(llvec, step):
+    '''
+    drop-in for sequenceDirect: frame idx of llvec starts at idx * step.
+    the output length is kept as before (one extra step at the end)
+    '''
+    onsets, bufs = [], []
+    length = 0
+    for idx, vecList in enumerate(llvec):
+        for vec in vecList:
+            onsets.append(idx * step)
+            bufs.append(vec)
+        flen   = max([ len(vec) for vec in vecList ], default=1)
+        length = max(length, (idx + 1) * step + flen)
+    return mixEvents(onsets, bufs, length=length)
@@ -0,0 +1,92 @@
+'''
+batch note rendering.
+
+renderNotes renders a list of (octave, key, dur, vol) notes into one
+contiguous f32 buffer: note i is buf[starts[i]:starts[i]+lens[i]].
+notes that render the same way at the same dur form a group. the row
+length of a group is known from its envelope, so the buffer is sized
+up front and every group is rendered straight into its own block of
+it, viewed as (notes x samples), in one vectorized pass. the python
+overhead grows with the number of groups (and pitches, for recorded
+samples) rather than with the number of notes.
+
+synth picks the sound:
+  'sample'   : sampleSynth (pianoSample.type, home/drumkit samples)
+  'piano'    : pianoAdditiveSynth
+  'fm'       : fmSynth (f32 batch engine)
+  'additive' : additiveSynth (vol in dB like the other synths)
+'''
+
+import numpy as np
+
+import basicsynth as bsynth
+from basicsynth import F32, FS, kt4fdv
+
+
+def groupKey(note, synth):
+    '(kind, dur) of a note, notes with equal keys render together'
+    if synth == 'sample':
+        kind = bsynth.sampleKind(note[1])
+        if kind == 'loop':
+            return kind, bsynth.sampleDur(note[1], note[2])
+        return kind, note[2]
+    if synth not in ('piano', 'fm', 'additive'):
+        raise ValueError(f'unknown synth: {synth}')
+    return synth, note[2]
+
+
+def rowLength(kind, note):
+    'number of samples of note rendered as kind'
+    dur = note[2]
+    if kind == 'additive':
+        return sum(bsynth.additiveAdsr(dur))
+    if kind == 'piano':
+        return sum(bsynth.pianoAdsr(dur))
+    if kind in ('fm', 'fmpiano'):
+        return sum(bsynth.fmAdsr(dur))
+    if kind == 'loop':
+        loop = bsynth.sampleLoop(note[0], note[1])
+        return loop.length(bsynth.sampleDur(note[1], dur), FS)
+    return len(bsynth.sampleSynth(*note))
+
+
+def renderGroup(notes, synth, out):
+    'render notes of one group key into the rows of out'
+    if synth == 'sample':
+        bsynth.sampleSynthBatch(notes, out)
+    elif synth == 'piano':
+        bsynth.pianoAdditiveSynthBatch(notes, out)
+    elif synth == 'fm':
+        bsynth.fmSynthBatch(notes, out=out)
+    else:
+        fdv = np.array([ kt4fdv(note) for note in notes ], dtype=np.float64)
+        bsynth.additiveSynthBatch(fdv[:, 0], fdv[0, 1], fdv[:, 2], out)
+    return out
+
+
+def renderNotes(notes, synth='sample'):
+    '''
+    notes : rows of (octave, key, dur, vol), e.g. list of tuples or a
+            structured array
+    returns (buf, starts, lens), one start and length per note
+    '''
+    notes  = [ tuple(note) for note in notes ]
+    groups = {}
+    for idx, note in enumerate(notes):
+        groups.setdefault(groupKey(note, synth), []).append(idx)
+    starts = np.zeros(len(notes), dtype=np.int64)
+    lens   = np.zeros(len(notes), dtype=np.int64)
+    blocks = []
+    size   = 0
+    for (kind, dur), idxs in groups.items():
+        idxs.sort(key=lambda idx: notes[idx][:2])   # runs of one pitch
+        nsamp = rowLength(kind, notes[idxs[0]])
+        starts[idxs] = size + nsamp * np.arange(len(idxs))
+        lens[idxs]   = nsamp
+        blocks.append((idxs, size, nsamp))
+        size += nsamp * len(idxs)
+    buf = np.empty(size, dtype=F32)
+    for idxs, pos, nsamp in blocks:
+        out = buf[pos:pos+nsamp*len(idxs)].reshape(len(idxs), nsamp)
+        renderGroup([ notes[idx] for idx in idxs ], synth, out)
+    return buf, starts, lens
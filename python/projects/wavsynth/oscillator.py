@@ -0,0 +1,110 @@
+'''
+phase-accumulator sine oscillators used by the synths.
+
+phase is kept as a 32 bit fixed-point fraction of a cycle (uint32), so
+it wraps around by itself and never loses precision over long notes.
+sinOsc turns such a phase into f32 samples with one of three engines,
+picked per call or globally through sinOsc.engine:
+
+  'exact' : np.sin in float64 on the phase. the synths keep their
+            original np.sin(2 pi f t) code for this engine, so output
+            is unchanged (reference, slowest).
+  'f32'   : np.sin in float32 on the wrapped phase. error < 1e-6
+            (~6e-7: float32 rounding of the phase), about 8-10x faster
+            than 'exact'.
+  'table' : linear interpolation in a precomputed single-cycle table
+            of TABLE_SIZE points. error < 5e-7, only about 1.2-1.5x
+            faster than 'exact' (numpy gathers are slower than a
+            vectorized f32 sin on most x86 machines, so 'f32' is
+            usually the better pick).
+
+both fast engines quantize frequency to fs / 2**32 (~1e-5 Hz at 48k),
+i.e. a phase drift of well under a milliradian per second of audio.
+
+NOTE: rendered notes are cached, switch engines with
+basicsynth.setOscEngine() so that stale notes are dropped.
+'''
+
+import numpy as np
+
+F32 = np.float32
+
+TABLE_BITS = 12
+TABLE_SIZE = 2 ** TABLE_BITS
+FRAC_BITS  = 32 - TABLE_BITS
+PHASE_ONE  = 2.0 ** 32          # one full cycle in fixed point
+
+# single cycle of sin, with a guard point so idx+1 never wraps
+_table = F32(np.sin(2 * np.pi * np.arange(TABLE_SIZE + 1) / TABLE_SIZE))
+_slope = F32(np.diff(_table))
+
+
+def phaseInc(freq, fs):
+    'frequency (scalar or array, may be negative) to fixed-point increment'
+    inc = np.rint(np.multiply(freq, PHASE_ONE / fs, dtype=np.float64))
+    return inc.astype(np.int64).astype(np.uint32)   # wraps mod 2**32
+
+
+def phaseRamp(freq, nsamp, fs, phase0=0, out=None):
+    '''
+    phase accumulator for constant frequency.
+    freq   : scalar, or a vector (gives a partials x samples phase)
+    phase0 : starting phase (fixed point, one per freq), e.g. carried
+             over from the previous block
+    out    : optional uint32 buffer for the phase
+    returns the uint32 phase and the phase to carry into the next block
+    '''
+    inc    = phaseInc(freq, fs)
+    tx     = np.arange(nsamp, dtype=np.uint32)
+    phase  = np.multiply.outer(inc, tx, out=out)    # wraps mod 2**32
+    phase += np.asarray(phase0, dtype=np.uint32)[..., None]
+    phase1 = (np.uint64(inc) * np.uint64(nsamp) + np.uint64(phase0))
+    phase1 = np.uint32(phase1 & np.uint64(0xFFFFFFFF))
+    return phase, phase1
+
+
+def phaseCumsum(freqs, fs, phase0=0):
+    'phase accumulator for a per-sample frequency (e.g. fm carrier), per row'
+    phase  = np.cumsum(phaseInc(freqs, fs), axis=-1, dtype=np.uint32)
+    phase += np.uint32(phase0)
+    return phase
+
+
+def tableLookup(phase, out=None):
+    'sin of a fixed-point phase by linear interpolation in the table'
+    idx  = phase >> np.uint32(FRAC_BITS)
+    frac = phase & np.uint32(2 ** FRAC_BITS - 1)
+    frac = np.multiply(frac, F32(2.0 ** -FRAC_BITS), out=out, dtype=F32)
+    frac *= _slope.take(idx)
+    frac += _table.take(idx)
+    return frac
+
+
+def sinOsc(phase, amp=1.0, engine=None, out=None):
+    '''
+    sin(phase) * amp as f32
+    phase  : uint32 fixed-point phase from phaseRamp/phaseCumsum
+    engine : 'exact', 'f32' or 'table' (default: sinOsc.engine)
+    out    : optional f32 buffer for the result
+    '''
+    engine = engine or sinOsc.engine
+    if engine == 'exact':
+        wav = F32(np.sin(phase * (2 * np.pi / PHASE_ONE)) * amp)
+        if out is None:
+            return wav
+        out[...] = wav
+        return out
+    if engine == 'f32':
+        wav  = np.multiply(phase, F32(2 * np.pi / PHASE_ONE), out=out,
+                           dtype=F32)
+        wav  = np.sin(wav, out=wav)
+    elif engine == 'table':
+        wav = tableLookup(phase, out)
+    else:
+        raise ValueError(f'unknown oscillator engine: {engine}')
+    if np.any(amp != 1):
+        wav *= F32(amp)
+    return wav
+
+
+sinOsc.engine = 'exact'
@@ -0,0 +1,142 @@
+'''
+process-pool rendering of scores.
+
+the unique notes of a score are split in chunks and farmed out to a
+ProcessPoolExecutor. a worker renders its chunk with renderNotes and
+copies the ragged buffer into a shared memory block. only the block
+name, the starts and the lengths go back through the pipe, the audio is never
+pickled. the note and event tables are the ones of scorecompiler (vol
+of a klseq is an event gain), the main process maps the blocks and
+mixes the events exactly like renderEvents, so the output is the same
+for any number of workers.
+'''
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import basicsynth as bsynth
+import mixer
+import scorecompiler
+from basicsynth import F32, FS
+from noterender import renderNotes
+
+
+def initWorker(ptype, engine):
+    'carry the synth settings of the parent into a worker'
+    bsynth.pianoSample.type = ptype
+    bsynth.setOscEngine(engine)
+
+
+def renderChunk(notes, synth):
+    'worker: render notes into a new shared memory block'
+    buf, starts, lens = renderNotes(notes, synth)
+    shm = SharedMemory(create=True, size=max(buf.nbytes, 1))
+    np.ndarray(buf.shape, dtype=F32, buffer=shm.buf)[:] = buf
+    name = shm.name
+    shm.close()         # the parent unlinks it once the mix is done
+    return name, len(buf), starts, lens
+
+
+def renderScore(events, notes, synth='sample', workers=None, tail=0,
+                minlen=0, chunksize=8):
+    '''
+    scorecompiler.renderEvents with the notes rendered in a process pool
+    events  : EVENT_DTYPE table, (onset, note id, gain) of each event
+    notes   : the unique notes, rows of (octave, key, dur, vol)
+    synth   : see noterender.py
+    workers : number of processes (default: all cores, 1: no pool)
+    tail    : extra samples after the end of each event
+    minlen  : minimum output length
+    '''
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(notes) <= chunksize:
+        return scorecompiler.renderEvents(events, notes, synth, tail, minlen)
+    chunks = [ notes[i:i+chunksize] for i in range(0, len(notes), chunksize) ]
+    names  = []             # every block a worker created
+    shms   = []
+    try:
+        views  = renderChunks(chunks, synth, workers, names, shms)
+        lens   = np.array([ len(view) for view in views ], dtype=np.int64)
+        length = scorecompiler.mixLength(events, lens, tail, minlen)
+        bufs   = [ views[nid] for nid in events['note'] ]
+        music  = mixer.mixEvents(events['onset'], bufs, events['gain'],
+                                 length)
+    finally:
+        bufs = views = None     # drop views before closing the blocks
+        for shm in shms:
+            shm.close()
+        for name in names:
+            unlinkBlock(name)
+    return music
+
+
+def renderChunks(chunks, synth, workers, names, shms):
+    '''
+    render chunks in a process pool, returns the views of all notes in
+    order. the name of a block is added to names as soon as its worker
+    is done, also when another chunk failed (the pool waits for all of
+    them before the error comes out), so the caller can always unlink
+    every block. the mapped blocks are added to shms
+    '''
+    def record(future):
+        if not future.cancelled() and future.exception() is None:
+            names.append(future.result()[0])
+
+    initargs = (bsynth.pianoSample.type, bsynth.sinOsc.engine)
+    # workers must share our tracker, a tracker of their own would
+    # unlink their blocks as soon as the worker exits
+    resource_tracker.ensure_running()
+    views = []
+    try:
+        with ProcessPoolExecutor(workers, initializer=initWorker,
+                                 initargs=initargs) as pool:
+            futures = [ pool.submit(renderChunk, chunk, synth)
+                        for chunk in chunks ]
+            for future in futures:
+                future.add_done_callback(record)
+            for future in futures:
+                name, size, starts, lens = future.result()
+                shm = SharedMemory(name=name)
+                shms.append(shm)
+                buf = np.ndarray(size, dtype=F32, buffer=shm.buf)
+                views.extend(buf[start:start+n]
+                             for start, n in zip(starts, lens))
+    except BaseException:
+        views = buf = None      # the traceback keeps this frame alive
+        raise
+    return views
+
+
+def unlinkBlock(name):
+    'remove a shared memory block (if it is still there)'
+    try:
+        shm = SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def klseq2musicParallel(klseq, kdur=1, step=8000, workers=None):
+    'basicsequencer.klseq2music rendered with a process pool'
+    events, notes = scorecompiler.compileKlseq(klseq, kdur, step)
+    return renderScore(events, notes, 'additive', workers, tail=step,
+                       minlen=len(klseq) * step + 1 if klseq else 0)
+
+
+def pat2wavParallel(pat, tstep=12000, extradur=0.25, workers=None):
+    'basicmelody.pat2wav rendered with a process pool'
+    dur = tstep / FS
+    table = {}              # note -> note id, in order of appearance
+    rows  = []
+    for idx, frame in enumerate(pat):
+        for val in frame:
+            note = (val[0], val[1], dur*val[2] + extradur, val[3])
+            rows.append((idx * tstep, table.setdefault(note, len(table)), 1))
+    events = np.array(rows, dtype=scorecompiler.EVENT_DTYPE)
+    music  = renderScore(events, list(table), 'sample', workers, tail=tstep,
+                         minlen=len(pat) * tstep + 1 if pat else 0)
+    return music * 0.5
@@ -0,0 +1,170 @@
+'''
+array backed patterns.
+
+a Pattern holds all tones of a pattern (see basicmelody.py) in one
+read-only structured array of TONE_DTYPE, plus the number of frames
+(trailing empty frames count). a tone is (frame, pitch, dur, vol, inst):
+  inst  : 0 piano key, 1 home sample (H), 2 drumkit sample (K),
+          3 forced piano sample (P prefix)
+  pitch : 12 * octave + key index for pianos, line number for samples
+repeat / merge / concat / background / elongate build new patterns with
+a few array operations, no per tone python work and no deep copies.
+fromList and toList convert from and to the list of lists format.
+'''
+
+import numpy as np
+
+import basicsynth as bsynth
+import mixer
+from basicsynth import FS
+from scoreparser import KEYS, KEY_INDEX, INT16_MAX
+
+TONE_DTYPE  = np.dtype([ ('frame', np.int32), ('pitch', np.int16),
+                         ('dur', np.int16), ('vol', np.int16),
+                         ('inst', np.int8) ])
+INSTRUMENTS = ( '', 'H', 'K', 'P' )
+
+
+def toneId(oc, key):
+    '(octave, key) of a tone -> (inst, pitch)'
+    if key[0] in 'HK':
+        return INSTRUMENTS.index(key[0]), int(key[1:])
+    if key[0] == 'P':
+        return 3, 12 * oc + KEY_INDEX[key[1:]]
+    return 0, 12 * oc + KEY_INDEX[key]
+
+
+def toneValue(value, name):
+    'dur or vol of a tone as an int, ValueError if TONE_DTYPE can not hold it'
+    if not float(value).is_integer() or abs(value) > INT16_MAX:
+        raise ValueError(f'Pattern: {name} must be an integer within '
+                         f'+-{INT16_MAX}, got {value!r}')
+    return int(value)
+
+
+def toneKey(inst, pitch):
+    '(inst, pitch) -> (octave, key) of a tone'
+    if inst in (1, 2):
+        return 0, f'{INSTRUMENTS[inst]}{pitch}'
+    return pitch // 12, INSTRUMENTS[inst] + KEYS[pitch % 12]
+
+
+class Pattern:
+    'immutable pattern: tones (TONE_DTYPE, sorted by frame) and nframes'
+
+    def __init__(self, tones, nframes):
+        tones = np.asarray(tones, dtype=TONE_DTYPE)
+        order = np.argsort(tones['frame'], kind='stable')
+        tones = tones[order]
+        tones.setflags(write=False)
+        self.tones   = tones
+        self.nframes = int(nframes)
+
+    @classmethod
+    def fromList(cls, pat):
+        '''
+        from a list of frames of [octave, key, dur, vol] tones. dur and
+        vol are stored as int16, anything else is a ValueError
+        '''
+        rows = [ (fidx, pitch, toneValue(dur, 'dur'), toneValue(vol, 'vol'),
+                  inst)
+                 for fidx, frame in enumerate(pat)
+                 for oc, key, dur, vol in frame
+                 for inst, pitch in [ toneId(oc, key) ] ]
+        return cls(np.array(rows, dtype=TONE_DTYPE), len(pat))
+
+    def toList(self):
+        'back to the list of lists format'
+        pat = [ [] for _ in range(self.nframes) ]
+        for frame, pitch, dur, vol, inst in self.tones.tolist():
+            oc, key = toneKey(inst, pitch)
+            pat[frame].append([ oc, key, dur, vol ])
+        return pat
+
+    def __len__(self):
+        return self.nframes
+
+    def __add__(self, other):
+        return self.concat(other)
+
+    def __repr__(self):
+        return f'Pattern({self.nframes} frames, {len(self.tones)} tones)'
+
+    def shift(self, nframes):
+        'the tones moved by nframes (the result is nframes longer)'
+        tones = self.tones.copy()
+        tones['frame'] += nframes
+        return Pattern(tones, self.nframes + nframes)
+
+    def concat(self, other):
+        'other after self (like list.extend)'
+        tones = np.concatenate((self.tones, other.tones))
+        tones['frame'][len(self.tones):] += self.nframes
+        return Pattern(tones, self.nframes + other.nframes)
+
+    def repeat(self, count):
+        'the pattern count times in a row (repeatPatten)'
+        tones  = np.tile(self.tones, count)
+        offset = np.repeat(np.arange(count) * self.nframes, len(self.tones))
+        tones['frame'] += offset.astype(np.int32)
+        return Pattern(tones, self.nframes * count)
+
+    def merge(self, other):
+        '''
+        tones of both patterns in every frame, the shorter one decides
+        the length (basicmelody.merge)
+        '''
+        nframes = min(self.nframes, other.nframes)
+        tones   = np.concatenate((self.tones, other.tones))
+        return Pattern(tones[tones['frame'] < nframes], nframes)
+
+    def overlay(self, bg):
+        'bg repeated to the length of the pattern and merged into it'
+        if not bg.nframes:
+            return self
+        count = -(-self.nframes // bg.nframes)
+        return self.merge(bg.repeat(count))
+
+    def background(self, frames):
+        '''
+        addBackground: frames (list of lists, e.g. from
+        basicmelody.chordKeyseqExpand) repeated under the pattern
+        '''
+        return self.overlay(Pattern.fromList(frames))
+
+    def elongate(self, dist=2):
+        '''
+        a tone followed by dist or more empty frames is held over them
+        (basicmelody.elongate, for frames with any number of tones)
+        '''
+        frames = self.tones['frame']
+        used   = np.unique(frames)
+        nxt    = np.append(used[1:], self.nframes)
+        gap    = (nxt - used - 1)[np.searchsorted(used, frames)]
+        tones  = self.tones.copy()
+        tones['dur'] += np.where(gap >= dist, gap, 0).astype(np.int16)
+        return Pattern(tones, self.nframes)
+
+    def render(self, tstep=12000, extradur=0.25):
+        '''
+        pat2wav of the pattern: every unique tone is synthesized once
+        and placed at all of its frames
+        '''
+        tones  = self.tones
+        fields = tones[[ 'pitch', 'dur', 'vol', 'inst' ]]
+        uniq, ids = np.unique(fields, return_inverse=True)
+        dur    = tstep / FS
+        vecs   = []
+        for pitch, d, vol, inst in uniq.tolist():
+            oc, key = toneKey(inst, pitch)
+            vecs.append(bsynth.sampleSynth(oc, key, dur*d + extradur, vol))
+        ids    = ids.ravel()
+        bufs   = [ vecs[i] for i in ids ]
+        onsets = tones['frame'].astype(np.int64) * tstep
+        lens   = np.array([ len(vec) for vec in vecs ], dtype=np.int64)
+        ends   = onsets + tstep + lens[ids]
+        length = max(int(ends.max(initial=0)),
+                     self.nframes * tstep + 1 if self.nframes else 0)
+        music  = mixer.mixEvents(onsets, bufs, length=length)
+        music *= np.float32(0.5)
+        return music
@@ -0,0 +1,169 @@
+'''
+real-time playback.
+
+PlaybackEngine pulls blocks from a block stream (see streamsynth.py) in
+a callback, one block per deadline of blocksize / fs seconds. it times
+every callback and counts the blocks that took longer than their
+deadline (underruns). where the blocks go is up to a sink:
+  NullSink   : discards them, paced to real time or as fast as possible
+  WavSink    : writes them to a wav/flac file (also paced or not)
+  DeviceSink : plays them on a sound device (needs sounddevice)
+the first two need no audio hardware, so the engine can be tested and
+profiled on headless machines.
+'''
+
+import time
+import numpy as np
+
+import streamsynth
+import wavstream
+from basicsynth import FS, F32
+
+
+class PlaybackEngine:
+    'block callback over a stream of f32 blocks, with timing stats'
+
+    def __init__(self, blocks, blocksize=1024, fs=FS):
+        self.blocks    = iter(blocks)
+        self.blocksize = blocksize
+        self.fs        = fs
+        self.deadline  = blocksize / fs     # seconds per block
+        self.times     = []                 # render time of each block
+        self.misses    = 0                  # blocks later than deadline
+        self.xruns     = 0                  # underruns reported by a device
+        self.valid     = 0                  # samples of out that are audio
+        self.done      = False
+
+    def callback(self, out):
+        '''
+        fill out (blocksize samples) with the next block, pads with zeros
+        at the end. returns False once the stream is exhausted
+        '''
+        t0    = time.perf_counter()
+        block = next(self.blocks, None)
+        if block is None:
+            self.done  = True
+            self.valid = 0
+            out[:] = 0
+            return False
+        n = self.valid = len(block)
+        out[:n] = block
+        out[n:] = 0
+        spent = time.perf_counter() - t0
+        self.times.append(spent)
+        self.misses += spent > self.deadline
+        return True
+
+    def stats(self):
+        'render time, deadline misses and cpu load as a dict'
+        times = np.array(self.times)
+        if not len(times):
+            times = np.zeros(1)
+        return dict(blocks=len(self.times), misses=self.misses,
+                    xruns=self.xruns, deadline=self.deadline,
+                    mean=float(times.mean()), max=float(times.max()),
+                    p99=float(np.percentile(times, 99)),
+                    load=float(times.mean() / self.deadline))
+
+
+class NullSink:
+    '''
+    discards the audio
+    realtime : wait for every deadline like a device would (a block that
+               is ready after its deadline is an underrun), False runs
+               as fast as possible
+    '''
+
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+
+    def write(self, block):
+        pass
+
+    def close(self):
+        pass
+
+    def run(self, engine):
+        out  = np.zeros(engine.blocksize, dtype=F32)
+        due  = time.perf_counter()
+        while engine.callback(out):
+            self.write(out[:engine.valid])
+            if not self.realtime:
+                continue
+            due += engine.deadline
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            else:
+                engine.xruns += 1
+                due = time.perf_counter()   # resync after a dropout
+        self.close()
+
+
+class WavSink(NullSink):
+    'writes the audio to a wav/flac file'
+
+    def __init__(self, path, fs=FS, realtime=False):
+        super().__init__(realtime)
+        self.fo = wavstream.openWriter(path, fs)
+
+    def write(self, block):
+        self.fo.write(block)
+
+    def close(self):
+        self.fo.close()
+
+
+def deviceAvailable():
+    'True if sounddevice is installed and there is an output device'
+    try:
+        import sounddevice as sd
+        sd.query_devices(kind='output')
+    except Exception:
+        return False
+    return True
+
+
+class DeviceSink:
+    'plays the audio on the default output device (needs sounddevice)'
+
+    def __init__(self, device=None):
+        import sounddevice
+        self.sd     = sounddevice
+        self.device = device
+
+    def run(self, engine):
+        sd = self.sd
+
+        def callback(outdata, frames, ctime, status):
+            if status.output_underflow:
+                engine.xruns += 1
+            if not engine.callback(outdata[:, 0]):
+                raise sd.CallbackStop
+
+        with sd.OutputStream(samplerate=engine.fs, blocksize=engine.blocksize,
+                             channels=1, dtype='float32', device=self.device,
+                             callback=callback) as stream:
+            while stream.active:
+                time.sleep(0.05)
+
+
+def defaultSink():
+    'a sound device when there is one, else a real-time paced NullSink'
+    return DeviceSink() if deviceAvailable() else NullSink(realtime=True)
+
+
+def play(events, sink=None, blocksize=1024):
+    '''
+    play (onset, voice) events (see streamsynth.py) on sink
+    returns the engine stats
+    '''
+    blocks = streamsynth.streamMix(events, blocksize)
+    engine = PlaybackEngine(blocks, blocksize)
+    (sink or defaultSink()).run(engine)
+    return engine.stats()
+
+
+def playKlseq(klseq, kdur=1, step=12000, sink=None, blocksize=1024):
+    'audition a klseq (see basicsequencer) live'
+    return play(streamsynth.klseqVoices(klseq, kdur, step), sink, blocksize)
@@ -0,0 +1,93 @@
+'''
+persistent, content-addressed cache of rendered notes.
+
+a note is stored as f32 .npy under root/<xx>/<sha1>.npy, where the sha1
+covers the synth version and the note key. the writes go through a temp
+file + rename, and the reads treat a missing or broken file as a miss.
+so several processes can share one cache dir without locking. the total
+size is kept below maxbytes by dropping the least recently used files
+(a hit touches the file's mtime).
+'''
+
+import os
+import hashlib
+import numpy as np
+
+DEFAULT_DIR = os.environ.get(
+        'WAVSYNTH_CACHE',
+        os.path.join(os.path.expanduser('~'), '.cache', 'wavsynth'))
+
+
+class RenderCache:
+    'note audio on disk, shared across runs and processes'
+
+    def __init__(self, root=DEFAULT_DIR, maxbytes=2 * 2**30, version=''):
+        self.root     = root
+        self.maxbytes = maxbytes
+        self.version  = version
+        self.written  = maxbytes    # forces a trim on the first put
+        self.hits     = 0
+        self.misses   = 0
+        os.makedirs(root, exist_ok=True)
+
+    def keyPath(self, key):
+        digest = hashlib.sha1(repr((self.version, key)).encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest + '.npy')
+
+    def get(self, key):
+        'cached audio for key or None'
+        path = self.keyPath(key)
+        try:
+            audio = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return audio
+
+    def put(self, key, audio):
+        path = self.keyPath(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp  = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as fo:
+            np.save(fo, np.asarray(audio, dtype=np.float32))
+        os.replace(tmp, path)
+        self.written += audio.nbytes
+        if self.written > self.maxbytes // 8:
+            self.trim()
+        return audio
+
+    def fetch(self, key, render):
+        'cached audio for key, else render() and store it'
+        audio = self.get(key)
+        if audio is None:
+            audio = self.put(key, render())
+        return audio
+
+    def trim(self):
+        'drop least recently used files until the cache fits in maxbytes'
+        files = []
+        for dirpath, _, fnames in os.walk(self.root):
+            for fname in fnames:
+                if not fname.endswith('.npy'):
+                    continue    # skip in-flight temp files
+                path = os.path.join(dirpath, fname)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue    # removed by another process
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.maxbytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self.written = 0
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
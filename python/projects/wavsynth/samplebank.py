@@ -0,0 +1,82 @@
+'''
+decoded sample bank.
+
+every ogg is decoded only once. the f32 pcm is stored as <name>.f32.npy
+next to the sample, and later runs memory-map it read-only. so warm
+runs skip vorbis decoding entirely, and worker processes share the
+pages. the cache file is rebuilt when the ogg is newer than it, and it
+is written through a temp file + rename, so concurrent workers never see
+a half written file. if the samples dir is read-only, the decoded audio
+is just kept in memory.
+'''
+
+import os
+import numpy as np
+import soundfile as sf
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'samples')
+
+
+class SampleBank:
+    'ogg samples decoded once, served as read-only f32 arrays'
+
+    def __init__(self, root=SAMPLES_DIR, rate=48000):
+        self.root     = root
+        self.rate     = rate
+        self.arrays   = {}      # relpath -> f32 array (memmap)
+        self.wavlists = {}      # subdir  -> list of file names
+
+    def cachePath(self, fname):
+        return fname + '.f32.npy'
+
+    def decode(self, fname):
+        'decode fname to f32 and try to leave a cache file next to it'
+        audio, rate = sf.read(fname, dtype='float32')
+        assert rate == self.rate, f'{fname}: {rate} Hz, expected {self.rate}'
+        cname = self.cachePath(fname)
+        tmp   = f'{cname}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'wb') as fo:
+                np.save(fo, audio)
+            os.replace(tmp, cname)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return audio
+        return np.load(cname, mmap_mode='r')
+
+    def load(self, relpath):
+        'f32 pcm of samples/<relpath> (decoded at most once per machine)'
+        audio = self.arrays.get(relpath)
+        if audio is not None:
+            return audio
+        fname = os.path.join(self.root, relpath)
+        cname = self.cachePath(fname)
+        try:
+            fresh = os.path.getmtime(cname) >= os.path.getmtime(fname)
+        except OSError:
+            fresh = False
+        if fresh:
+            audio = np.load(cname, mmap_mode='r')
+        else:
+            audio = self.decode(fname)
+        self.arrays[relpath] = audio
+        return audio
+
+    def wavlist(self, subdir):
+        'lines of samples/<subdir>/wavlist.txt (parsed once)'
+        lines = self.wavlists.get(subdir)
+        if lines is None:
+            with open(os.path.join(self.root, subdir, 'wavlist.txt')) as fi:
+                lines = [ line.strip() for line in fi ]
+            self.wavlists[subdir] = lines
+        return lines
+
+    def byWavlist(self, subdir, idx):
+        'sample at line idx (1 based) of the wavlist in subdir'
+        fname = self.wavlist(subdir)[idx-1]
+        return self.load(f'{subdir}/{fname}')
+
+
+sampleBank = SampleBank()
@@ -0,0 +1,81 @@
+'''
+score compiler.
+
+a klseq (see basicsequencer) is compiled into two tables:
+  notes  : the unique sounds, rows of (octave, key, dur, vol)
+  events : one row per key token, (onset sample, note id, gain)
+volume only scales a note, so it goes into the event gain and the note
+is rendered at 0 dB. a motif that repeats hundreds of times is rendered
+once and then placed many times by the mixer.
+'''
+
+import numpy as np
+
+import basicsynth as bsynth
+import mixer
+from noterender import renderNotes
+from scoreparser import KEYS
+
+EVENT_DTYPE = np.dtype([ ('onset', np.int64), ('note', np.int32),
+                         ('gain', np.float32) ])
+NOTE_DTYPE  = np.dtype([ ('octave', np.int16), ('key', 'U2'),
+                         ('dur', np.float64), ('vol', np.float64) ])
+
+
+def compileKlseq(klseq, kdur=1, step=8000):
+    '''
+    klseq : list of list of keys
+    kdur  : base key duration
+    step  : step in samples
+    returns (events, notes), structured arrays of EVENT_DTYPE, NOTE_DTYPE
+    '''
+    parsed = {}             # key token -> (note, gain)
+    table  = {}             # note -> note id, in order of appearance
+    rows   = []
+    for idx, frame in enumerate(klseq):
+        for key in frame:
+            if key not in parsed:
+                oc, k, d, v = bsynth.parseKey(key)
+                parsed[key] = (oc, k, d * kdur, 0), 10 ** (v/10)
+            note, gain = parsed[key]
+            rows.append((idx * step, table.setdefault(note, len(table)), gain))
+    events = np.array(rows, dtype=EVENT_DTYPE)
+    notes  = np.array(list(table), dtype=NOTE_DTYPE)
+    return events, notes
+
+
+def compileTokens(tokens, kdur=1, step=8000):
+    '''
+    compileKlseq for a token table from scoreparser, fully vectorized.
+    notes are ordered by (pitch, dur) instead of order of appearance
+    '''
+    code = tokens['pitch'].astype(np.int64) << 16 | tokens['dur']
+    uniq, ids = np.unique(code, return_inverse=True)
+    events = np.empty(len(tokens), dtype=EVENT_DTYPE)
+    events['onset'] = tokens['frame'].astype(np.int64) * step
+    events['note']  = ids
+    events['gain']  = 10 ** (tokens['vol'] / 10)
+    pitch  = uniq >> 16
+    notes  = np.zeros(len(uniq), dtype=NOTE_DTYPE)
+    notes['octave'] = pitch // 12
+    notes['key']    = np.array(KEYS)[pitch % 12]
+    notes['dur']    = (uniq & 0xffff) * kdur
+    return events, notes
+
+
+def renderEvents(events, notes, synth='additive', tail=0, minlen=0):
+    '''
+    render every unique note once and mix the events
+    tail   : extra samples after the end of each event
+    minlen : minimum output length
+    '''
+    buf, starts, lens = renderNotes(notes, synth)
+    length = mixLength(events, lens, tail, minlen)
+    return mixer.mixRagged(events['onset'], events['note'], buf, starts,
+                           lens, events['gain'], length)
+
+
+def mixLength(events, lens, tail=0, minlen=0):
+    'output length: end of the last event (lens : samples of each note)'
+    ends = events['onset'] + lens[events['note']] + tail
+    return max(int(ends.max(initial=0)), minlen)
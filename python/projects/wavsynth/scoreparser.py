@@ -0,0 +1,111 @@
+'''
+txtmusic parser.
+
+reads a score (see txtmusic/) line by line, without joining the file,
+and emits a compact token table straight away: one row of
+(frame, pitch, dur, vol) per key, where pitch = 12 * octave + key index
+(c = 0, ..., b = 11). a token is parsed once; repeats are a dict lookup.
+a bad token raises ScoreSyntaxError with file, line and column.
+'''
+
+import re
+import numpy as np
+
+from basicsynth import keyPatten
+
+KEYS       = 'c c# d d# e f f# g g# a a# b'.split()
+KEY_INDEX  = { key: idx for idx, key in enumerate(KEYS) }
+TOKEN_DTYPE = np.dtype([ ('frame', np.int32), ('pitch', np.int16),
+                         ('dur', np.int16), ('vol', np.int16) ])
+INT16_MAX   = np.iinfo(np.int16).max
+KEY_FORMAT  = 'expected <oc><key>[<dur>][+/-<vol>], e.g. 3c#4+2'
+
+_keypatt = keyPatten()
+_tokpatt = re.compile(r'\||[^\s|]+')
+
+
+class ScoreSyntaxError(ValueError):
+    'bad token in a score, with its position'
+
+    def __init__(self, token, filename, line, col, reason=KEY_FORMAT):
+        self.token    = token
+        self.filename = filename
+        self.line     = line
+        self.col      = col
+        super().__init__(f'{filename}:{line}:{col}: bad key {token!r} '
+                         f'({reason})')
+
+
+def parseToken(token):
+    '''
+    key token -> (pitch, dur, vol). ValueError (with the reason) if it
+    is not a valid key or dur / vol do not fit in TOKEN_DTYPE
+    '''
+    mt = _keypatt.match(token)
+    if mt is None:
+        raise ValueError(KEY_FORMAT)
+    oc, key, dur, vol = mt.groups()
+    pitch = 12 * int(oc) + KEY_INDEX[key]
+    dur   = 1 if dur is None else int(dur)
+    vol   = 0 if vol is None else int(vol)
+    if dur > INT16_MAX:
+        raise ValueError(f'dur is at most {INT16_MAX}')
+    if abs(vol) > INT16_MAX:
+        raise ValueError(f'vol is within +-{INT16_MAX}')
+    return pitch, dur, vol
+
+
+def tokenColumn(line, token):
+    'column (1 based) of the first occurrence of token in line'
+    for mt in _tokpatt.finditer(line):
+        if mt.group() == token:
+            return mt.start() + 1
+    return 1
+
+
+def parseLines(lines, filename='<string>'):
+    '''
+    lines : iterable of lines (an open file is read lazily)
+    returns (tokens, nframes), tokens is a TOKEN_DTYPE array.
+    frames are separated by |, line breaks are only whitespace
+    '''
+    known  = {}             # token -> (pitch, dur, vol)
+    frames, rows = [], []
+    frame  = 0
+    for lineno, line in enumerate(lines, 1):
+        if line.lstrip().startswith('#'):
+            continue
+        for bar, piece in enumerate(line.split('|')):
+            frame += bar > 0
+            for token in piece.split():
+                row = known.get(token)
+                if row is None:
+                    try:
+                        row = parseToken(token)
+                    except ValueError as err:
+                        col = tokenColumn(line, token)
+                        raise ScoreSyntaxError(token, filename, lineno, col,
+                                               str(err)) from None
+                    known[token] = row
+                frames.append(frame)
+                rows.append(row)
+    rows   = np.array(rows, dtype=np.int16).reshape(-1, 3)
+    tokens = np.empty(len(rows), dtype=TOKEN_DTYPE)
+    tokens['frame'] = np.array(frames, dtype=np.int32)
+    tokens['pitch'], tokens['dur'], tokens['vol'] = rows.T
+    return tokens, frame + 1
+
+
+def parseFile(path):
+    'parseLines for a txtmusic file'
+    with open(path) as fi:
+        return parseLines(fi, path)
+
+
+def tokens2klseq(tokens, nframes):
+    'back to the list of list of keys used by basicsequencer'
+    klseq = [ [] for _ in range(nframes) ]
+    for frame, pitch, dur, vol in tokens.tolist():
+        key = f'{pitch // 12}{KEYS[pitch % 12]}{dur}{vol:+d}'
+        klseq[frame].append(key)
+    return klseq
@@ -0,0 +1,100 @@
+'''
+pattern segments.
+
+a Segment is an immutable, hashable piece of a pattern (see
+basicmelody.py): frames of (octave, key, dur, vol) tones, frozen into
+tuples with the hash computed once. equal segments are equal keys, so a
+track given as a list of segments renders every unique segment once
+(with its tail) and places that audio at each of its occurrences.
+generated tracks repeat their parts a lot, so most of a track comes
+from the cache.
+'''
+
+import numpy as np
+
+import basicsynth as bsynth
+import mixer
+from audiocache import audioCache, sharedCache
+from basicsynth import FS, F32
+
+
+class Segment:
+    'immutable piece of a pattern, usable as a dict key'
+
+    __slots__ = ('frames', '_hash')
+
+    def __init__(self, pat):
+        frames = tuple(tuple(tuple(tone) for tone in frame) for frame in pat)
+        object.__setattr__(self, 'frames', frames)
+        object.__setattr__(self, '_hash', hash(frames))
+
+    def __setattr__(self, name, val):
+        raise AttributeError('Segment is immutable')
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return (isinstance(other, Segment) and self._hash == other._hash
+                and self.frames == other.frames)
+
+    def __repr__(self):
+        return f'Segment({len(self)} frames, {self._hash & 0xffffff:06x})'
+
+    def pattern(self):
+        'back to a (mutable) list pattern'
+        return [ [ list(tone) for tone in frame ] for frame in self.frames ]
+
+
+def splitPattern(pat, size=16):
+    'cut a list pattern into segments of size frames (the last may be shorter)'
+    return [ Segment(pat[idx:idx+size]) for idx in range(0, len(pat), size) ]
+
+
+@audioCache(sharedCache)
+def segmentAudio(seg, tstep, extradur, ptype):
+    '''
+    audio of one segment as pat2wav renders it (without the 0.5 gain),
+    including the tails past its last frame. ptype is pianoSample.type,
+    it is only here to be part of the cache key
+    '''
+    dur = tstep / FS
+    llvec = [ [ bsynth.sampleSynth(val[0], val[1], dur*val[2] + extradur,
+                                   val[3]) for val in frame ]
+              for frame in seg.frames ]
+    audio = mixer.sequenceFrames(llvec, tstep)
+    audio.setflags(write=False)
+    return audio
+
+
+def isTrack(pat):
+    'True for a list of segments'
+    return bool(pat) and isinstance(pat[0], Segment)
+
+
+def trackEvents(segs, tstep=12000, extradur=0.25):
+    '''
+    renderTrack as lazy (onset, audio) events, one per segment, for
+    wavstream.slidingMix (without the 0.5 gain)
+    '''
+    ptype = bsynth.pianoSample.type
+    onset = 0
+    for seg in segs:
+        yield onset, segmentAudio(seg, tstep, extradur, ptype)
+        onset += len(seg) * tstep
+
+
+def renderTrack(segs, tstep=12000, extradur=0.25):
+    '''
+    pat2wav for a list of segments: every unique segment is rendered
+    once and placed at the frame offset of each occurrence
+    '''
+    ptype  = bsynth.pianoSample.type
+    onsets = np.cumsum([ 0 ] + [ len(seg) for seg in segs[:-1] ]) * tstep
+    bufs   = [ segmentAudio(seg, tstep, extradur, ptype) for seg in segs ]
+    music  = mixer.mixEvents(onsets, bufs)
+    music *= F32(0.5)
+    return music
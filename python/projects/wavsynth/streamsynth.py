@@ -0,0 +1,124 @@
+'''
+block based streaming synthesis.
+
+instead of rendering every note to its full length up front, a score is
+turned into voices that render themselves block by block. a voice keeps
+its oscillator phases (fixed point, see oscillator.py) and its envelope
+position (lazy FadeEnvelope, see envelope.py) between blocks. streamMix
+mixes the active voices and yields f32 blocks, so memory only depends on
+the block size and the number of overlapping notes, not on the length
+of the score.
+'''
+
+import numpy as np
+
+import basicsynth as synth
+from basicsynth import FS, F32
+from oscillator import sinOsc, phaseRamp
+
+
+class AdditiveVoice:
+    'additiveSynth(freq, dur, vol) rendered block by block'
+
+    def __init__(self, freq, dur, vol):
+        hars, amps, fades, keep = synth.additivePartials(freq)
+        self.fhars = freq * hars[keep]
+        self.amps  = F32(amps[keep])[:, None]
+        self.env   = synth.additiveEnvelope(dur, fades[keep])
+        self.phase = np.zeros(len(self.fhars), dtype=np.uint32)
+        self.pos   = 0
+        # the envelopes only fall after attack + decay and the partials
+        # are harmonic, so the peak is within the first couple of periods
+        nhead, gains = synth.additiveLevel(freq, vol)
+        head       = min(int(nhead), len(self))
+        peak       = abs(self.partials(0, head, 0)[0]).max()
+        self.gain  = F32(float(np.prod(gains)) / peak)
+
+    def __len__(self):
+        return len(self.env)
+
+    def partials(self, start, nsamp, phase0):
+        'sum of the partials for [start, start+nsamp), and the next phase'
+        phase, phase1 = phaseRamp(self.fhars, nsamp, FS, phase0)
+        wav  = sinOsc(phase)
+        wav *= self.amps
+        wav *= self.env[start:start+nsamp]
+        return wav.sum(axis=0), phase1
+
+    def render(self, nsamp):
+        'next block of at most nsamp samples (shorter at the end)'
+        nsamp = min(nsamp, len(self) - self.pos)
+        block, self.phase = self.partials(self.pos, nsamp, self.phase)
+        block    *= self.gain
+        self.pos += nsamp
+        return block
+
+    @property
+    def done(self):
+        return self.pos >= len(self)
+
+
+class BufferVoice:
+    'plays a pre-rendered note (e.g. from sampleSynth) block by block'
+
+    def __init__(self, audio):
+        self.audio = audio
+        self.pos   = 0
+
+    def __len__(self):
+        return len(self.audio)
+
+    def render(self, nsamp):
+        block     = self.audio[self.pos:self.pos+nsamp]
+        self.pos += len(block)
+        return block
+
+    @property
+    def done(self):
+        return self.pos >= len(self.audio)
+
+
+def streamMix(events, blocksize=1024):
+    '''
+    mix voices into a stream of f32 blocks
+    events    : iterable of (onset sample, voice), sorted by onset. it
+                is consumed lazily, so it can be a generator
+    blocksize : samples per block (e.g. 256 - 4096)
+    the last block is cut where the last voice ends
+    '''
+    events  = iter(events)
+    pending = next(events, None)
+    active  = []        # [ voice, onset ]
+    pos     = 0
+    end     = 0
+    while active or pending is not None:
+        while pending is not None and pending[0] < pos + blocksize:
+            onset, voice = pending
+            active.append([ voice, onset ])
+            end = max(end, onset + len(voice))
+            pending = next(events, None)
+        block = np.zeros(blocksize, dtype=F32)
+        for item in active:
+            voice, onset = item
+            off = max(onset - pos, 0)
+            seg = voice.render(blocksize - off)
+            block[off:off+len(seg)] += seg
+        active = [ item for item in active if not item[0].done ]
+        if not active and pending is None:
+            block = block[:end-pos]
+        pos += blocksize
+        yield block
+
+
+def klseqVoices(klseq, kdur=1, step=8000):
+    'voices of a klseq (see basicsequencer), created lazily frame by frame'
+    for fidx, frame in enumerate(klseq):
+        for key in frame:
+            kt4 = synth.parseKey(key)   # key(str) -> (octave, key, dur, vol)
+            f, d, v = synth.kt4fdv(kt4) # -> (freq, dur, vol)
+            yield fidx * step, AdditiveVoice(f, d * kdur, v)
+
+
+def streamKlseq(klseq, kdur=1, step=8000, blocksize=1024):
+    'streaming version of basicsequencer.klseq2music'
+    return streamMix(klseqVoices(klseq, kdur, step), blocksize)
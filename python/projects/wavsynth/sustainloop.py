@@ -0,0 +1,80 @@
+'''
+sustain-loop rendering of recorded notes.
+
+applyEnv (basicsynth.py) turns a recorded note into a note of any
+duration: a short ramp in (attack), the recording as it is (sustain,
+dur seconds) and a linear fade out (release), normalized to its peak.
+SustainLoop splits this once per pitch:
+  attack  : the ramped head of the recording, precomputed
+  sustain : a view of the recording, no per duration work but a copy
+  release : the fade applied to the part of the recording after the
+            sustain (only `fall` samples)
+the peak of any sustain length is read from a running max of the
+recording. so the cache holds one SustainLoop per pitch, and every
+duration and volume is assembled from it.
+'''
+
+import numpy as np
+
+F32 = np.float32
+
+
+class SustainLoop:
+    'a recorded note, renderable at any duration and volume'
+
+    def __init__(self, audio, attack, fall):
+        audio       = np.asarray(audio, dtype=F32)
+        self.audio  = audio
+        self.attack = attack
+        self.fall   = fall
+        ramp        = np.linspace(0, 1, attack)
+        self.head   = F32(audio[:attack] * ramp[:len(audio)])
+        self.fade   = F32(np.linspace(1, 0, fall))
+        self.headPeak = float(abs(self.head).max(initial=0))
+        # runmax[n-1] is the peak of a sustain of n samples
+        self.runmax = np.maximum.accumulate(abs(audio[attack:]))
+
+    @property
+    def nbytes(self):
+        'bytes held by the loop (the recording itself is memory-mapped)'
+        return self.head.nbytes + self.fade.nbytes + self.runmax.nbytes
+
+    def length(self, dur, fs=48000):
+        'number of samples of a note of dur seconds'
+        return self.attack + int(dur * fs) + self.fall
+
+    def assemble(self, dur, out, fs=48000):
+        'the note of dur seconds before scaling, into out. returns its peak'
+        att, fall = self.attack, self.fall
+        nsus  = int(dur * fs)
+        audio = self.audio
+        out[:] = 0
+        out[:len(self.head)] = self.head
+        sus   = audio[att:att+nsus]                 # a view
+        out[att:att+len(sus)] = sus
+        rel   = audio[att+nsus:att+nsus+fall]
+        np.multiply(rel, self.fade[:len(rel)], out=out[att+nsus:][:len(rel)])
+        peak  = self.headPeak
+        if len(sus):
+            peak = max(peak, float(self.runmax[len(sus)-1]))
+        if len(rel):
+            peak = max(peak, float(abs(out[att+nsus:][:len(rel)]).max()))
+        return peak
+
+    def render(self, dur, vol, fs=48000):
+        '''
+        the note of dur seconds at vol (dB), same as applyEnv(audio, dur, vol)
+        up to float32 rounding
+        '''
+        out   = np.empty(self.length(dur, fs), dtype=F32)
+        peak  = self.assemble(dur, out, fs)
+        out  *= F32(10 ** (vol / 10) / peak)
+        return out
+
+    def renderBatch(self, dur, vols, out, fs=48000):
+        'render(dur, vol) for every vol of vols, one per row of out'
+        peak  = self.assemble(dur, out[0], fs)
+        scale = F32(10 ** (np.asarray(vols, dtype=np.float64) / 10) / peak)
+        np.multiply(out[0], scale[1:, None], out=out[1:])
+        out[0] *= scale[0]
+        return out
@@ -0,0 +1,72 @@
+'''
+streaming (chunked) wav/flac output.
+
+slidingMix mixes (onset, buffer) events into a sliding window that only
+has to hold the longest note tail plus one chunk. everything before the
+onset of the current event can no longer change, so it is handed out
+(in chunks) as soon as it is final. writeStream writes those chunks to a
+soundfile writer, so memory stays bounded however long the score is.
+'''
+
+import os
+import numpy as np
+import soundfile as sf
+
+F32 = np.float32
+
+
+def slidingMix(events, chunk=48000, gain=1):
+    '''
+    events : iterable of (onset, buffer), sorted by onset (lazy is fine).
+             a zero length buffer just extends the output up to its onset
+    chunk  : finished audio is released in pieces of at least this size
+    gain   : applied to everything that is released
+    yields f32 arrays, which concatenated give the full mix
+    '''
+    mix  = np.zeros(2 * chunk, dtype=F32)
+    base = 0        # sample position of mix[0]
+    end  = 0        # end of the last event seen so far
+    for onset, buf in events:
+        if onset - base >= chunk:
+            done = onset - base     # everything before onset is final
+            used = max(end - base, 0)
+            if done >= used:
+                if used:
+                    yield mix[:used] * F32(gain)
+                    mix[:used] = 0
+                for pos in range(used, done, chunk):    # silent gap
+                    yield np.zeros(min(chunk, done - pos), dtype=F32)
+            else:
+                yield mix[:done] * F32(gain)
+                keep = used - done
+                mix[:keep] = mix[done:used]
+                mix[keep:used] = 0
+            base = onset
+        need = onset - base + len(buf)
+        if need > len(mix):     # window grows to the longest tail seen
+            mix = np.concatenate((mix, np.zeros(need, dtype=F32)))
+        mix[onset-base:need] += buf
+        end = max(end, onset + len(buf))
+    if end > base:
+        yield mix[:end-base] * F32(gain)
+
+
+def openWriter(out, fs, subtype=None):
+    '''
+    mono soundfile writer for out (.wav or .flac)
+    wav defaults to float samples (like wavfile.write of f32), flac to 24 bit
+    '''
+    if subtype is None:
+        ext = os.path.splitext(out)[1].lower()
+        subtype = 'PCM_24' if ext == '.flac' else 'FLOAT'
+    return sf.SoundFile(out, 'w', samplerate=fs, channels=1, subtype=subtype)
+
+
+def writeStream(out, blocks, fs, subtype=None):
+    'write an iterable of f32 blocks to out (see openWriter)'
+    nsamp = 0
+    with openWriter(out, fs, subtype) as fo:
+        for block in blocks:
+            fo.write(block)
+            nsamp += len(block)
+    return nsamp